@@ -1,11 +1,337 @@
+import contextlib
+import itertools
+import json
 import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
 import numpy as np
 from tqdm import tqdm
 from typing import Tuple
-from numba import njit
+from numba import config, get_num_threads, njit, prange, set_num_threads
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 
+import profiling
 
-@njit
+
+class Workspace:
+    """
+    Scratch arrays kept between averaging calls. Engines ask for buffers by name,
+    and buffer is allocated again only if requested shape changes, so iterations
+    of the same field run without allocations.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._shared = {}
+
+    def get(self, name: str, shape: tuple, dtype: np.dtype = np.float64) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None or array.shape != tuple(shape) or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self._arrays[name] = array
+        return array
+
+    def shared(self, name: str, shape: tuple, dtype: np.dtype = np.float64) -> np.ndarray:
+        """Like get, but buffer lives in shared memory, so worker processes of direct
+        averaging read and write it in place. Free such buffers with release_shared"""
+        entry = self._shared.get(name)
+        if entry is not None and entry[1].shape == tuple(shape) and entry[1].dtype == dtype:
+            return entry[1]
+        if entry is not None:
+            del entry
+            self._release(name)
+        shm, array = _create_shared_field(shape, dtype)
+        _shared_blocks[shm.name] = (array.__array_interface__['data'][0], array.nbytes)
+        self._shared[name] = (shm, array)
+        return array
+
+    def release_shared(self, name: str = None):
+        """Frees shared buffer of name, all of them if None. Arrays got from shared
+        must not be used after"""
+        for name in list(self._shared) if name is None else [name]:
+            if name in self._shared:
+                self._release(name)
+
+    def _release(self, name: str):
+        shm, _ = self._shared.pop(name)
+        _shared_blocks.pop(shm.name, None)
+        shm.unlink()
+        try:
+            shm.close()
+        except BufferError:
+            # arrays still refer to it, mapping goes away with them
+            pass
+
+
+# shared memory name to (address, size) of buffers made by Workspace.shared
+_shared_blocks = {}
+
+
+def _shared_location(array: np.ndarray) -> tuple:
+    """(shared memory name, byte offset) of C-contiguous array inside buffer of
+    Workspace.shared, None for any other array"""
+    if not array.flags.c_contiguous:
+        return None
+    address = array.__array_interface__['data'][0]
+    for name, (start, size) in _shared_blocks.items():
+        if start <= address and address + array.nbytes <= start + size:
+            return name, address - start
+    return None
+
+
+FIELD_DTYPES = [np.dtype(np.float32), np.dtype(np.float64)]
+
+
+def _field_signatures(*templates: str) -> list:
+    """
+    Eager numba signatures of kernel for every dtype of FIELD_DTYPES,
+    {f} in templates stands for field type
+    """
+    return [template.format(f=dtype.name) for template in templates for dtype in FIELD_DTYPES]
+
+
+def field_dtype(field) -> np.dtype:
+    """
+    Storage dtype engines use for given field: float32 fields stay float32,
+    anything else is averaged in float64. Sums are always accumulated in float64.
+    """
+    dtype = np.dtype(getattr(field, "dtype", np.float64))
+    return dtype if dtype in FIELD_DTYPES else np.dtype(np.float64)
+
+
+def _prepare_out(out: np.ndarray, shape: tuple, dtype: np.dtype = np.float64) -> np.ndarray:
+    """Returns out checked to fit result of given shape, or new array if out is None"""
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != tuple(shape) or out.dtype != dtype or not out.flags.c_contiguous:
+        raise ValueError("out must be C-contiguous " + np.dtype(dtype).name +
+                         " array of shape " + str(tuple(shape)))
+    return out
+
+
+PROGRESS_INTERVAL = 0.1  # seconds between progress reports of one task
+
+
+class TqdmProgressSink:
+    """Shows every Progress as tqdm bar, with tqdm options given to Progress"""
+
+    def __init__(self):
+        self._bars = {}
+
+    def report(self, progress: "Progress", state: dict):
+        bar = self._bars.get(id(progress))
+        if bar is None:
+            bar = tqdm(total=state["total"], desc=state["task"], **progress.options)
+            self._bars[id(progress)] = bar
+        bar.n = state["done"]
+        if state["info"]:
+            bar.set_postfix({key: f"{value:.3e}" if isinstance(value, float) else value
+                             for key, value in state["info"].items()}, refresh=False)
+        if state["status"] in ("end", "cancelled"):
+            self._bars.pop(id(progress)).close()
+        else:
+            bar.refresh()
+
+
+class JsonLinesProgressSink:
+    """
+    Writes every progress report as json line: "task", "done", "total", "elapsed"
+    seconds, "rate" per second, "status" (start, update, end or cancelled), "info" dict
+    of engine values like residual. Lines are flushed, so reader sees them at once.
+    """
+
+    def __init__(self, stream=None, fd: int = None):
+        """
+        Args:
+            stream: text stream to write to, sys.stdout if neither is given
+            fd (int): file descriptor to write to instead of stream, left open
+        """
+        if fd is not None:
+            stream = os.fdopen(fd, "w", buffering=1, closefd=False)
+        self.stream = stream if stream is not None else sys.stdout
+        self._lock = threading.Lock()
+
+    def report(self, progress: "Progress", state: dict):
+        line = json.dumps(state) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+_progress_sinks = None
+_cancel_event = None
+
+
+def set_progress_sinks(sinks: list):
+    """Sets sinks getting reports of every later Progress, None restores tqdm bars"""
+    global _progress_sinks
+    _progress_sinks = sinks
+
+
+class AveragingCancelled(Exception):
+    """Raised inside running engine at its next progress update after cancel event is set"""
+
+
+def set_cancel_event(event: threading.Event):
+    """
+    Sets event stopping engines: once it is set, every Progress update raises
+    AveragingCancelled, so engines stop at the next row, slab, pass part or
+    iteration they report. While event is given, engines track their passes
+    even without visuals, reporting to no sink. None turns cancelling off
+    """
+    global _cancel_event
+    _cancel_event = event
+
+
+class Progress:
+    """
+    Progress of one task in units engines count, like rows, slabs or iterations.
+    update is cheap: sinks get report only when PROGRESS_INTERVAL passed since the
+    last one, and always at start and end. Engines create Progress only when
+    visuals are on, so progress costs nothing otherwise. Updates raise
+    AveragingCancelled once event given to set_cancel_event is set, and sinks
+    then get "cancelled" report. Use as context manager:
+
+        with Progress(rows, "Averaging") as progress:
+            for row in range(rows):
+                ...
+                progress.update()
+    """
+
+    def __init__(self, total: int, task: str = "", sinks: list = None,
+                 interval: float = PROGRESS_INTERVAL, **options):
+        """
+        Args:
+            total (int): units of task
+            task (str): task name shown by sinks
+            sinks (list): sinks to report to, ones set by set_progress_sinks if None
+            interval (float): least seconds between reports
+            options: tqdm arguments for TqdmProgressSink
+        """
+        self.total = total
+        self.task = task
+        self.done = 0
+        self.info = {}
+        self.options = options
+        self.interval = interval
+        if sinks is None:
+            sinks = _progress_sinks if _progress_sinks is not None else [TqdmProgressSink()]
+        self.sinks = sinks
+        self.cancel = _cancel_event
+        self._start = self._last = time.monotonic()
+        self._report("start")
+
+    def update(self, count: int = 1, **info):
+        """Adds count done units, info values are shown with next report"""
+        self.set(self.done + count, **info)
+
+    def set(self, done: int, **info):
+        """Sets number of done units, info values are shown with next report"""
+        if self.cancel is not None and self.cancel.is_set():
+            raise AveragingCancelled(self.task)
+        self.done = done
+        if info:
+            self.info.update(info)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._report("update")
+
+    def close(self, status: str = "end"):
+        self._report(status)
+
+    def _report(self, status: str):
+        elapsed = time.monotonic() - self._start
+        state = {"task": self.task, "done": self.done, "total": self.total,
+                 "elapsed": elapsed, "rate": self.done / elapsed if elapsed > 0 else 0.0,
+                 "status": status, "info": dict(self.info)}
+        for sink in self.sinks:
+            sink.report(self, state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close("cancelled" if exc_type is AveragingCancelled else "end")
+
+
+# parts every pass of separable and compiled gauss engines is split in,
+# so their progress is reported while a pass runs
+PROGRESS_STEPS = 16
+
+
+def _pass_progress(visuals: bool, total: int):
+    """
+    Context manager giving Progress of one averaging pass of total units
+    the way direct engine shows it. Without visuals it is silent one checking
+    cancel event, if it is set by set_cancel_event, and None otherwise
+    """
+    if visuals:
+        return Progress(total, "⚊ Iteration Progress", ncols=100, leave=False, position=0)
+    if _cancel_event is not None:
+        return Progress(total, sinks=[])
+    return contextlib.nullcontext()
+
+
+def _lines_number(shape: tuple, axes) -> int:
+    """Lines passes along axes of field of shape go through, units of their progress"""
+    return sum(int(np.prod(shape)) // shape[axis] for axis in axes)
+
+
+RESIDUAL_NORMS = ['max', 'rms']
+
+
+@njit(_field_signatures("void({f}[::1], {f}[::1], float64[::1])",
+                        "void(Array({f}, 1, 'C', readonly=True), {f}[::1], float64[::1])",
+                        "void({f}[:], {f}[:], float64[::1])",
+                        "void(Array({f}, 1, 'A', readonly=True), {f}[:], float64[::1])"),
+      nogil=True, cache=True)
+def _accumulate_residual(previous: np.ndarray, current: np.ndarray, residual: np.ndarray):
+    for index in range(previous.shape[0]):
+        change = abs(current[index] - previous[index])
+        residual[0] = max(residual[0], change)
+        residual[1] += change * change
+
+
+def _residual_pass(previous: np.ndarray, current: np.ndarray, residual: np.ndarray):
+    """Separate residual pass for engines that cant track it while averaging"""
+    if residual is not None:
+        _accumulate_residual(np.ravel(np.asarray(previous, dtype=current.dtype)),
+                             np.ravel(current), residual)
+
+
+def _merge_residuals(residual: np.ndarray, partials: np.ndarray):
+    """Adds (parts, 2) residuals tracked by threads or chunks into residual"""
+    residual[0] = max(residual[0], np.max(partials[:, 0]))
+    residual[1] += np.sum(partials[:, 1])
+
+
+def residual_norm(residual: np.ndarray, size: int, norm: str = 'max') -> float:
+    """
+    Change between two iterations from tracked residual.
+    Args:
+        residual (np.ndarray): float64 pair of max abs change and sum of squared changes,
+                               filled by averaging functions given residual argument
+        size (int): number of points in field
+        norm (str): one of RESIDUAL_NORMS
+    Returns:
+        float: max abs or root mean square change
+    """
+    if norm not in RESIDUAL_NORMS:
+        raise ValueError("Unknown residual norm: " + str(norm))
+    if norm == 'max':
+        return float(residual[0])
+    return float(np.sqrt(residual[1] / size))
+
+
+@njit(_field_signatures("float64(int64, int64, int64, {f}[:, :, ::1], int64)",
+                        "float64(int64, int64, int64, {f}[:, :, :], int64)",
+                        "float64(int64, int64, int64, Array({f}, 3, 'A', readonly=True), int64)"),
+      cache=True)
 def average_this_3d_point(i: int, j: int, k: int, in_field: np.ndarray, radius: int) -> float:
     """
     Basic method of 3-Dimensional averaging. Takes average value of
@@ -28,31 +354,56 @@ def average_this_3d_point(i: int, j: int, k: int, in_field: np.ndarray, radius:
     k_end = min(d - 1, k + radius)
     window_size = (i_end - i_start + 1) * \
         (j_end - j_start + 1) * (k_end - k_start + 1)
-    window_sum = np.sum(
-        in_field[i_start:i_end + 1, j_start:j_end + 1, k_start:k_end + 1])
+    window_sum = 0.0
+    for i_window in range(i_start, i_end + 1):
+        for j_window in range(j_start, j_end + 1):
+            for k_window in range(k_start, k_end + 1):
+                window_sum += in_field[i_window, j_window, k_window]
+    return window_sum / window_size
+
+
+@njit(_field_signatures("float64(int64, int64, {f}[:, ::1], int64)",
+                        "float64(int64, int64, {f}[:, :], int64)",
+                        "float64(int64, int64, Array({f}, 2, 'A', readonly=True), int64)"),
+      cache=True)
+def average_this_2d_point(i: int, j: int, in_field: np.ndarray, radius: int) -> float:
+    n, m = in_field.shape
+    i_start = max(0, i - radius)
+    i_end = min(n - 1, i + radius)
+    j_start = max(0, j - radius)
+    j_end = min(m - 1, j + radius)
+    window_size = (i_end - i_start + 1) * (j_end - j_start + 1)
+    window_sum = 0.0
+    for i_window in range(i_start, i_end + 1):
+        for j_window in range(j_start, j_end + 1):
+            window_sum += in_field[i_window, j_window]
+
     return window_sum / window_size
 
 
 def basic_3d_array_averaging(inputed_field: np.ndarray, radius: int,
-                             visuals: bool = False) -> np.ndarray:
+                             visuals: bool = False, out: np.ndarray = None) -> np.ndarray:
     """
     Function takes field and use basic 3d averaging method. Gives back averaged field
     Args:
         inputed_field (np.ndarray): field to get averaged
         radius (int): averaging radius around array point
+        out (np.ndarray): array to write result to, new one is allocated if None
     Returns:
         np.ndarray: peasantly averaged 3d field
     """
+    # point kernels are compiled for float fields only
+    inputed_field = np.asarray(inputed_field, dtype=field_dtype(inputed_field))
     n, m, d = inputed_field.shape
-    output_field = np.zeros((n, m, d))
+    output_field = _prepare_out(out, (n, m, d), inputed_field.dtype)
     if visuals:
-        with tqdm(total=n * m * d) as pbar:
+        with Progress(n, "Averaging rows") as progress:
             for i in range(n):
                 for j in range(m):
                     for k in range(d):
                         output_field[i][j][k] = average_this_3d_point(i, j, k, inputed_field,
                                                                       radius)
-                        pbar.update(1)
+                progress.update()
     else:
         for i in range(n):
             for j in range(m):
@@ -62,64 +413,247 @@ def basic_3d_array_averaging(inputed_field: np.ndarray, radius: int,
     return output_field
 
 
-def process_func_3d(args):
-    i, j, k, inputed_field, radius, average_this_3d_point_func = args
-    return average_this_3d_point_func(i, j, k, inputed_field, radius)
+def _split_ranges(size: int, parts: int):
+    step = max(1, -(-size // max(1, min(parts, size))))
+    return [(start, min(size, start + step)) for start in range(0, size, step)]
+
+
+@njit(_field_signatures("void({f}[:, :, ::1], {f}[:, :, ::1], int64, int64, int64)"),
+      nogil=True, cache=True)
+def _average_slab_3d(in_field: np.ndarray, out_field: np.ndarray, radius: int,
+                     start: int, end: int):
+    n, m, d = in_field.shape
+    for i in range(start, end):
+        for j in range(m):
+            for k in range(d):
+                out_field[i, j, k] = average_this_3d_point(i, j, k, in_field, radius)
+
+
+@njit(_field_signatures("void({f}[:, ::1], {f}[:, ::1], int64, int64, int64)"),
+      nogil=True, cache=True)
+def _average_slab_2d(in_field: np.ndarray, out_field: np.ndarray, radius: int,
+                     start: int, end: int):
+    n, m = in_field.shape
+    for i in range(start, end):
+        for j in range(m):
+            out_field[i, j] = average_this_2d_point(i, j, in_field, radius)
+
+
+def _create_shared_field(shape: tuple,
+                         dtype: np.dtype) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _process_slab(args) -> int:
+    """
+    Worker side of basic_*_array_averaging_parallel. Attaches to shared input and
+    output by name and offset and averages rows [start, end) of the output. Windows of border
+    rows read the r-row halo straight from shared input, so nothing is copied.
+    With shared counter given, rows are averaged one by one and the number of done
+    rows is written into the task's own slot of the counter, which parent reads
+    for progress without any messages. Slot 0 is stop flag set by parent on
+    cancelling, then the rest of rows is skipped
+    """
+    (in_name, in_offset), (out_name, out_offset), shape, dtype, radius, start, end, \
+        counter_name, task = args
+    average_slab = _average_slab_3d if len(shape) == 3 else _average_slab_2d
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    counter_shm = None
+    try:
+        in_field = np.ndarray(shape, dtype=dtype, buffer=in_shm.buf, offset=in_offset)
+        out_field = np.ndarray(shape, dtype=dtype, buffer=out_shm.buf, offset=out_offset)
+        if counter_name is None:
+            average_slab(in_field, out_field, radius, start, end)
+        else:
+            counter_shm = shared_memory.SharedMemory(name=counter_name)
+            counter = np.ndarray((task + 2,), dtype=np.int64, buffer=counter_shm.buf)
+            for row in range(start, end):
+                if counter[0]:
+                    break
+                average_slab(in_field, out_field, radius, row, row + 1)
+                counter[task + 1] = row + 1 - start
+            del counter
+        del in_field, out_field
+    finally:
+        in_shm.close()
+        out_shm.close()
+        if counter_shm is not None:
+            counter_shm.close()
+    return end - start
+
+
+def _init_worker():
+    """Compiles slab kernels once per worker process, so later calls run warm"""
+    for dtype in FIELD_DTYPES:
+        _average_slab_2d(np.zeros((1, 1), dtype), np.zeros((1, 1), dtype), 1, 0, 1)
+        _average_slab_3d(np.zeros((1, 1, 1), dtype), np.zeros((1, 1, 1), dtype), 1, 0, 1)
+
+
+class AveragingExecutor:
+    """
+    Owner of worker processes and threads reused by averaging functions.
+    Pools start on first use, so passing executor to an engine that doesn't
+    need them costs nothing. Use as context manager:
+
+        if __name__ == "__main__":
+            with AveragingExecutor(4) as executor:
+                basic_3d_averaging_iterations(field, 10, 2, 4, executor=executor)
+
+    Worker processes are started by forkserver, or spawn where there is no forkserver,
+    never by fork, since forking after compiled parallel kernels started their threads
+    hangs workers. Both start methods import the main module of the program in every
+    worker, so scripts using the process pool, directly or through 'direct' engines,
+    must keep their top-level code under the __main__ guard as above.
+    """
+
+    def __init__(self, processes: int = 4):
+        self.processes = max(1, processes)
+        self._pool = None
+        self._thread_pool = None
+
+    @property
+    def pool(self) -> multiprocessing.pool.Pool:
+        """Process pool with slab kernels already compiled in every worker"""
+        if self._pool is None:
+            # forking after compiled parallel kernels started their threads hangs workers
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                'forkserver' if 'forkserver' in methods else 'spawn')
+            self._pool = context.Pool(processes=self.processes, initializer=_init_worker)
+        return self._pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        """Thread pool for nogil kernels"""
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.processes)
+        return self._thread_pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _release_shared_field(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+def _slab_array_averaging(inputed_field: np.ndarray, radius: int, max_processes: int,
+                          visuals: bool, executor: AveragingExecutor = None,
+                          out: np.ndarray = None) -> np.ndarray:
+    field = np.asarray(inputed_field, dtype=field_dtype(inputed_field))
+    n = field.shape[0]
+    out = _prepare_out(out, field.shape, field.dtype)
+
+    # buffers of Workspace.shared are used in place, others are copied through
+    # temporary shared memory
+    in_shm = out_shm = shared_out = None
+    try:
+        in_location = _shared_location(field)
+        if in_location is None:
+            in_shm, shared_in = _create_shared_field(field.shape, field.dtype)
+            shared_in[...] = field
+            del shared_in
+            in_location = (in_shm.name, 0)
+        out_location = _shared_location(out)
+        if out_location is None:
+            out_shm, shared_out = _create_shared_field(field.shape, field.dtype)
+            out_location = (out_shm.name, 0)
+
+        # several slabs per process keep workers busy when rows cost differently
+        ranges = _split_ranges(n, 4 * max_processes)
+        # rows done are polled for progress bar or for cancel event checks
+        tracked = visuals or _cancel_event is not None
+        counter_shm = None
+        if tracked:
+            # stop flag, then one slot per task: every task writes only its own slot,
+            # so no locking is needed
+            counter_shm, counter = _create_shared_field((len(ranges) + 1,), np.int64)
+            counter[...] = 0
+        counter_name = counter_shm.name if counter_shm is not None else None
+        args_list = [(in_location, out_location, field.shape, field.dtype.str, radius,
+                      start, end, counter_name, task)
+                     for task, (start, end) in enumerate(ranges)]
+
+        own_executor = executor is None
+        if own_executor:
+            executor = AveragingExecutor(max_processes)
+        try:
+            done = executor.pool.map_async(_process_slab, args_list)
+            if tracked:
+                with _pass_progress(visuals, n) as progress:
+                    try:
+                        while not done.ready():
+                            done.wait(PROGRESS_INTERVAL)
+                            progress.set(int(counter[1:].sum()))
+                    except AveragingCancelled:
+                        # workers stop after their current row, shared fields outlive them
+                        counter[0] = 1
+                        done.wait()
+                        raise
+            done.get()
+        finally:
+            if own_executor:
+                executor.close()
+            if counter_shm is not None:
+                del counter
+                _release_shared_field(counter_shm)
+
+        if out_shm is not None:
+            # input copy is released before copying result out
+            if in_shm is not None:
+                _release_shared_field(in_shm)
+                in_shm = None
+            out[...] = shared_out
+    finally:
+        del shared_out
+        for shm in (in_shm, out_shm):
+            if shm is not None:
+                _release_shared_field(shm)
+
+    return out
 
 
 def basic_3d_array_averaging_parallel(inputed_field: np.ndarray,
                                       radius: int, max_processes: int = 4,
-                                      visuals: bool = False) -> np.ndarray:
+                                      visuals: bool = False,
+                                      executor: AveragingExecutor = None,
+                                      out: np.ndarray = None) -> np.ndarray:
     """
     Basic method of 3-Dimensional averaging using parallel computations.
     Takes average value of all point around given point with given radius.
+    Input and output live in shared memory and every process averages
+    its own slab of rows, so field is never pickled to workers.
     Args:
         inputed_field (NDArray): field to get averaged
         radius (int): averaging radius around array point
         max_processes (int): maximum of processes to use
         visuals (bool): enables progress bar verbose
+        executor (AveragingExecutor): pool to reuse, new one is started if None
+        out (NDArray): array to write result to, new one is allocated if None
     Returns:
         NDArray: peasantly averaged 3d field
     """
-    n, m, d = inputed_field.shape
-    output_field = np.zeros((n, m, d))
-    pool = multiprocessing.Pool(processes=max_processes)
-    args_list = [(i, j, k, inputed_field, radius, average_this_3d_point)
-                 for i in range(n) for j in range(m) for k in range(d)]
-    chunksize = int(max([1, (n * m * d) / (4 * max_processes)]))
-    if visuals:
-        results = list(tqdm(pool.imap(process_func_3d, args_list, chunksize=chunksize),
-                            total=(n * m * d), miniters=1000, ncols=100, leave=False,
-                            position=0, desc="⚊ Iteration Progress"))
-    else:
-        results = list(pool.imap(process_func_3d,
-                       args_list, chunksize=chunksize))
-    pool.close()
-    f = 0
-    for i in range(0, n):
-        for j in range(0, m):
-            for k in range(0, d):
-                output_field[i][j][k] = results[f]
-                f += 1
-
-    return output_field
-
-
-@njit
-def average_this_2d_point(i: int, j: int, in_field: np.ndarray, radius: int) -> float:
-    n, m = in_field.shape
-    i_start = max(0, i - radius)
-    i_end = min(n - 1, i + radius)
-    j_start = max(0, j - radius)
-    j_end = min(m - 1, j + radius)
-    window_size = (i_end - i_start + 1) * (j_end - j_start + 1)
-    window_sum = np.sum(in_field[i_start:i_end + 1, j_start:j_end + 1])
-
-    return window_sum / window_size
+    return _slab_array_averaging(inputed_field, radius, max_processes, visuals, executor, out)
 
 
 def basic_2d_array_averaging(inputed_field: np.ndarray, radius: int,
-                             visuals: bool = False) -> np.ndarray:
+                             visuals: bool = False, out: np.ndarray = None) -> np.ndarray:
     """
     Basic method of 2-Dimensional averaging. Takes average value of
     all point around given point with given radius.
@@ -127,18 +661,21 @@ def basic_2d_array_averaging(inputed_field: np.ndarray, radius: int,
         inputed_field (NDArray): field to get averaged
         radius (int): averaging radius around array point
         visuals (bool): enables progress bar verbose
+        out (NDArray): array to write result to, new one is allocated if None
     Returns:
         NDArray: peasantly averaged 2d field
     """
+    # point kernels are compiled for float fields only
+    inputed_field = np.asarray(inputed_field, dtype=field_dtype(inputed_field))
     n, m = inputed_field.shape
-    output_field = np.zeros((n, m))
+    output_field = _prepare_out(out, (n, m), inputed_field.dtype)
     if visuals:
-        with tqdm(total=n * m) as pbar:
+        with Progress(n, "Averaging rows") as progress:
             for i in range(n):
                 for j in range(m):
                     output_field[i][j] = average_this_2d_point(
                         i, j, inputed_field, radius)
-                    pbar.update(1)
+                progress.update()
     else:
         for i in range(n):
             for j in range(m):
@@ -147,46 +684,435 @@ def basic_2d_array_averaging(inputed_field: np.ndarray, radius: int,
     return output_field
 
 
-def process_func_2d(args):
-    i, j, inputed_field, radius, average_this_2d_point_func = args
-    return average_this_2d_point_func(i, j, inputed_field, radius)
-
-
 def basic_2d_array_averaging_parallel(inputed_field: np.ndarray,
                                       radius: int, max_processes: int = 4,
-                                      visuals: bool = False) -> np.ndarray:
+                                      visuals: bool = False,
+                                      executor: AveragingExecutor = None,
+                                      out: np.ndarray = None) -> np.ndarray:
     """
     Basic method of 2-Dimensional averaging using parallel computations.
     Takes average value of all point around given point with given radius.
+    Input and output live in shared memory and every process averages
+    its own slab of rows, so field is never pickled to workers.
     Args:
         inputed_field (NDArray): field to get averaged
         radius (int): averaging radius around array point
         max_processes (int): maximum of processes to use
         visuals (bool): enables progress bar verbose
+        executor (AveragingExecutor): pool to reuse, new one is started if None
+        out (NDArray): array to write result to, new one is allocated if None
     Returns:
         NDArray: peasantly averaged 2d field
     """
-    n, m = inputed_field.shape
-    output_field = np.zeros((n, m))
-    pool = multiprocessing.Pool(processes=max_processes)
-    args_list = [(i, j, inputed_field, radius, average_this_2d_point)
-                 for i in range(n) for j in range(m)]
-    chunksize = int(max([1, (n * m) / (4 * max_processes)]))
-    if visuals:
-        results = list(tqdm(pool.imap(process_func_2d, args_list, chunksize=chunksize),
-                            total=(n * m), miniters=1000, ncols=100, position=0,
-                            leave=False, desc="⚊ Iteration Progress"))
-    else:
-        results = list(pool.imap(process_func_2d,
-                       args_list, chunksize=chunksize))
-    pool.close()
-    k = 0
-    for i in range(0, n):
-        for j in range(0, m):
-            output_field[i][j] = results[k]
-            k += 1
+    return _slab_array_averaging(inputed_field, radius, max_processes, visuals, executor, out)
 
-    return output_field
+
+@njit("void(float64[:, ::1])", cache=True)
+def _compensated_prefix_sum_lines(lines: np.ndarray):
+    """
+    In-place running sum along the last axis of 2d array of lines.
+    Uses Kahan compensation so long lines do not lose low-order bits.
+    Args:
+        lines (np.ndarray): contiguous float64 array of shape (lines, length)
+    """
+    count, length = lines.shape
+    for line in range(count):
+        total = 0.0
+        compensation = 0.0
+        for index in range(length):
+            value = lines[line, index] - compensation
+            temp_total = total + value
+            compensation = (temp_total - total) - value
+            total = temp_total
+            lines[line, index] = total
+
+
+def summed_area_table(inputed_field: np.ndarray,
+                      progress: Progress = None) -> Tuple[np.ndarray, float]:
+    """
+    Builds zero-padded summed-area table (integral image) of 2d or 3d field.
+    Field is centred on its mean before summation, which keeps prefix sums
+    small for fields with big constant offset (pressure, temperature)
+    Args:
+        inputed_field (np.ndarray): field to build table for
+        progress (Progress): updated after every axis, if given
+    Returns:
+        Tuple[np.ndarray, float]: table with shape bigger by one in each axis
+        and the mean that was subtracted from field
+    """
+    field = np.asarray(inputed_field, dtype=np.float64)
+    centre = float(np.mean(field))
+
+    table = np.zeros(tuple(size + 1 for size in field.shape))
+    table[tuple(slice(1, None) for _ in field.shape)] = field - centre
+
+    for axis in range(field.ndim):
+        lines = np.ascontiguousarray(np.moveaxis(table, axis, -1))
+        lines_shape = lines.shape
+        lines = lines.reshape(-1, lines_shape[-1])
+        _compensated_prefix_sum_lines(lines)
+        table = np.moveaxis(lines.reshape(lines_shape), -1, axis)
+        if progress is not None:
+            progress.update()
+
+    return np.ascontiguousarray(table), centre
+
+
+def _window_bounds(size: int, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns start and end (exclusive) of averaging window for every index of axis,
+    clipped by field borders the same way average_this_*_point do
+    """
+    indices = np.arange(size)
+    return np.maximum(0, indices - radius), np.minimum(size - 1, indices + radius) + 1
+
+
+def _sat_steps(ndim: int) -> int:
+    """Progress units of _sat_array_averaging: table axes and window corners"""
+    return ndim + 2 ** ndim
+
+
+def _sat_array_averaging(inputed_field: np.ndarray, radius: int,
+                         out: np.ndarray = None, progress: Progress = None) -> np.ndarray:
+    field = np.asarray(inputed_field, dtype=np.float64)
+    table, centre = summed_area_table(field, progress)
+    bounds = [_window_bounds(size, radius) for size in field.shape]
+
+    window_sum = np.zeros(field.shape)
+    for corner in itertools.product((0, 1), repeat=field.ndim):
+        # inclusion-exclusion: corners with odd number of window starts are subtracted
+        sign = -1 if (field.ndim - sum(corner)) % 2 else 1
+        corner_index = np.ix_(*[bounds[axis][side] for axis, side in enumerate(corner)])
+        window_sum += sign * table[corner_index]
+        if progress is not None:
+            progress.update()
+
+    window_size = np.ones(field.shape)
+    for axis, (start, end) in enumerate(bounds):
+        shape = [1] * field.ndim
+        shape[axis] = -1
+        window_size = window_size * (end - start).reshape(shape)
+
+    window_sum /= window_size
+    window_sum += centre
+    out = _prepare_out(out, field.shape, field_dtype(inputed_field))
+    out[...] = window_sum
+    return out
+
+
+def sat_2d_array_averaging(inputed_field: np.ndarray, radius: int,
+                           out: np.ndarray = None) -> np.ndarray:
+    """
+    Basic method of 2-Dimensional averaging using summed-area table.
+    Gives same result as basic_2d_array_averaging, but cost doesnt depend on radius.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        radius (int): averaging radius around array point
+        out (NDArray): array to write result to, new one is allocated if None
+    Returns:
+        NDArray: peasantly averaged 2d field
+    """
+    return _sat_array_averaging(inputed_field, radius, out)
+
+
+def sat_3d_array_averaging(inputed_field: np.ndarray, radius: int,
+                           out: np.ndarray = None) -> np.ndarray:
+    """
+    Basic method of 3-Dimensional averaging using summed-area table.
+    Gives same result as basic_3d_array_averaging, but cost doesnt depend on radius.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        radius (int): averaging radius around array point
+        out (NDArray): array to write result to, new one is allocated if None
+    Returns:
+        NDArray: peasantly averaged 3d field
+    """
+    return _sat_array_averaging(inputed_field, radius, out)
+
+
+# number of neighbouring lines averaged together by one step of _box_mean_axis
+SEPARABLE_BLOCK = 64
+
+
+@njit(_field_signatures("void({f}[:, :, ::1], {f}[:, :, ::1], int64, float64[::1], float64[::1], "
+                        "none, none)",
+                        "void({f}[:, :, :], {f}[:, :, :], int64, float64[::1], float64[::1], "
+                        "none, none)",
+                        "void(Array({f}, 3, 'A', readonly=True), {f}[:, :, :], int64, "
+                        "float64[::1], float64[::1], none, none)",
+                        "void({f}[:, :, ::1], {f}[:, :, ::1], int64, float64[::1], float64[::1], "
+                        "{f}[:, :, ::1], float64[::1])",
+                        "void({f}[:, :, :], {f}[:, :, :], int64, float64[::1], float64[::1], "
+                        "{f}[:, :, :], float64[::1])",
+                        "void({f}[:, :, ::1], {f}[:, :, ::1], int64, float64[::1], float64[::1], "
+                        "Array({f}, 3, 'A', readonly=True), float64[::1])",
+                        "void(Array({f}, 3, 'A', readonly=True), {f}[:, :, :], int64, "
+                        "float64[::1], float64[::1], Array({f}, 3, 'A', readonly=True), "
+                        "float64[::1])"),
+      nogil=True, cache=True)
+def _box_mean_axis(source: np.ndarray, output: np.ndarray, radius: int,
+                   window_sum: np.ndarray, scratch: np.ndarray, reference: np.ndarray = None,
+                   residual: np.ndarray = None):
+    """
+    Sliding window mean along middle axis of (outer, length, inner) array.
+    Window is clipped by borders and renormalized by number of valid samples,
+    which is the 1d part of average_this_*_point. Up to SEPARABLE_BLOCK
+    neighbouring lines are copied into contiguous scratch and averaged together,
+    so every step adds and subtracts contiguous rows, and output may be the
+    same array as source.
+    Args:
+        source (np.ndarray): field lines to average
+        output (np.ndarray): array of same shape to write means to
+        radius (int): averaging radius
+        window_sum (np.ndarray): float64 scratch of SEPARABLE_BLOCK size
+        scratch (np.ndarray): flat float64 scratch of length * SEPARABLE_BLOCK size
+        reference (np.ndarray): field of output shape to track change from, if given
+        residual (np.ndarray): float64 pair the change is accumulated into
+    """
+    outer, length, inner = source.shape
+    width = window_sum.shape[0]
+    for o in range(outer):
+        for block_start in range(0, inner, width):
+            block_width = min(width, inner - block_start)
+            block = scratch[:length * block_width].reshape((length, block_width))
+            for index in range(length):
+                for c in range(block_width):
+                    block[index, c] = source[o, index, block_start + c]
+
+            for c in range(block_width):
+                window_sum[c] = 0.0
+            for index in range(min(radius, length)):
+                for c in range(block_width):
+                    window_sum[c] += block[index, c]
+
+            for index in range(length):
+                entering = index + radius
+                if entering < length:
+                    for c in range(block_width):
+                        window_sum[c] += block[entering, c]
+
+                leaving = index - radius - 1
+                if leaving >= 0:
+                    for c in range(block_width):
+                        window_sum[c] -= block[leaving, c]
+
+                window_size = min(length - 1, index + radius) - max(0, index - radius) + 1
+                for c in range(block_width):
+                    output[o, index, block_start + c] = window_sum[c] / window_size
+
+                if reference is not None:
+                    for c in range(block_width):
+                        change = abs(window_sum[c] / window_size
+                                     - reference[o, index, block_start + c])
+                        residual[0] = max(residual[0], change)
+                        residual[1] += change * change
+
+
+def _box_mean_axis_threaded(source: np.ndarray, output: np.ndarray, radius: int,
+                            max_threads: int, executor: AveragingExecutor,
+                            workspace: Workspace, max_length: int,
+                            reference: np.ndarray = None, residual: np.ndarray = None,
+                            progress: Progress = None):
+    outer, length, inner = source.shape
+    threads = max(1, max_threads)
+    # with progress the pass is split in more tasks than threads, reported as they finish
+    parts_number = threads if progress is None else max(threads, PROGRESS_STEPS)
+
+    # kernel releases GIL, so plain threads share the field without copies
+    if outer >= parts_number:
+        parts = [(slice(start, end),) for start, end in _split_ranges(outer, parts_number)]
+    else:
+        parts = [(slice(None), slice(None), slice(start, end))
+                 for start, end in _split_ranges(inner, parts_number)]
+    scratches = [(workspace.get("separable_sum_" + str(task), (SEPARABLE_BLOCK,)),
+                  workspace.get("separable_block_" + str(task), (max_length * SEPARABLE_BLOCK,)))
+                 for task in range(len(parts))]
+
+    # every task tracks own change, they are merged after all tasks are done
+    partials = [None] * len(parts)
+    if residual is not None:
+        partials = workspace.get("separable_residuals", (len(parts), 2))
+        partials[...] = 0
+    tasks = [(source[part], output[part], None if reference is None else reference[part], partial)
+             for part, partial in zip(parts, partials)]
+
+    if len(tasks) == 1:
+        _box_mean_axis(source, output, radius, *scratches[0], reference, partials[0])
+        if progress is not None:
+            progress.update(outer * inner)
+    else:
+        own_pool = executor is None
+        thread_pool = ThreadPoolExecutor(max_workers=threads) if own_pool \
+            else executor.thread_pool
+        try:
+            futures = [thread_pool.submit(_box_mean_axis, task_source, task_output, radius,
+                                          window_sum, scratch, task_reference, partial)
+                       for (task_source, task_output, task_reference, partial),
+                       (window_sum, scratch) in zip(tasks, scratches)]
+            try:
+                for future, (task_source, _, _, _) in zip(futures, tasks):
+                    future.result()
+                    if progress is not None:
+                        progress.update(task_source.shape[0] * task_source.shape[2])
+            except AveragingCancelled:
+                # tasks not started yet are dropped, running ones finish their lines
+                for future in futures:
+                    future.cancel()
+                wait_futures(futures)
+                raise
+        finally:
+            if own_pool:
+                thread_pool.shutdown()
+
+    if residual is not None:
+        _merge_residuals(residual, partials)
+
+
+def separable_array_averaging(inputed_field: np.ndarray, radius: int,
+                              max_threads: int = 1,
+                              executor: AveragingExecutor = None,
+                              out: np.ndarray = None,
+                              workspace: Workspace = None,
+                              axes: tuple = None,
+                              residual: np.ndarray = None,
+                              progress: Progress = None) -> np.ndarray:
+    """
+    Basic method of 2/3-Dimensional averaging done as sequence of 1d running sums,
+    one per axis. Gives same result as basic_*_array_averaging in O(N) per pass.
+    First pass reads inputed_field, the rest run in place in out, so with given
+    out and workspace nothing is allocated. Change from inputed_field is tracked
+    by the last pass itself, without extra traversal.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        radius (int): averaging radius around array point
+        max_threads (int): number of threads running the nogil kernels
+        executor (AveragingExecutor): owner of threads to reuse
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): line scratch to reuse between calls
+        axes (tuple): axes to average along, all by default. Batched fields
+                      of shape (C, ...) are averaged along axes 1.. in one go
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm
+        progress (Progress): updated by lines averaged, see _lines_number
+    Returns:
+        NDArray: peasantly averaged field
+    """
+    field = np.ascontiguousarray(inputed_field, dtype=field_dtype(inputed_field))
+    shape = field.shape
+    out = _prepare_out(out, shape, field.dtype)
+    if workspace is None:
+        workspace = Workspace()
+    if axes is None:
+        axes = range(field.ndim)
+
+    source = field
+    if len(axes) == 0:
+        out[...] = field
+        _residual_pass(field, out, residual)
+    for index, axis in enumerate(axes):
+        outer = int(np.prod(shape[:axis]))
+        inner = int(np.prod(shape[axis + 1:]))
+        last = index == len(axes) - 1 and residual is not None
+        _box_mean_axis_threaded(source.reshape(outer, shape[axis], inner),
+                                out.reshape(outer, shape[axis], inner), radius,
+                                max_threads, executor, workspace, max(shape),
+                                field.reshape(outer, shape[axis], inner) if last else None,
+                                residual if last else None, progress)
+        source = out
+
+    return out
+
+
+def _fft_size(size: int) -> int:
+    """Smallest 2^a * 3^b * 5^c not less than size, which numpy fft handles fast"""
+    best = 1
+    while best < size:
+        best *= 2
+    power3 = 1
+    while power3 < best:
+        power5 = power3
+        while power5 < best:
+            candidate = power5
+            while candidate < size:
+                candidate *= 2
+            best = min(best, candidate)
+            power5 *= 5
+        power3 *= 3
+    return best
+
+
+def _ones_convolution(size: int, kernel: np.ndarray) -> np.ndarray:
+    """Kernel convolved with line of ones clipped to its size, i.e. weight of valid samples"""
+    half = (kernel.shape[0] - 1) // 2
+    return np.convolve(np.ones(size), kernel)[half:half + size]
+
+
+def _fft_steps(ndim: int) -> int:
+    """Progress units of _fft_separable_convolution: two transforms and kernel axes"""
+    return ndim + 2
+
+
+def _fft_separable_convolution(inputed_field: np.ndarray, kernels: list,
+                               progress: Progress = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zero-padded 'same' convolution of field with separable kernel via rfftn.
+    Field is centred on its mean first and the constant part is added back
+    exactly, so fft round-off scales with field deviation, not its offset.
+    Args:
+        inputed_field (np.ndarray): 2d or 3d field
+        kernels (list): odd length symmetric 1d kernel for every axis
+        progress (Progress): updated after every stage, if given
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: convolved field and convolved ones-mask
+    """
+    field = np.asarray(inputed_field, dtype=np.float64)
+    centre = float(np.mean(field))
+    halves = [(kernel.shape[0] - 1) // 2 for kernel in kernels]
+    fft_shape = [_fft_size(size + 2 * half) for size, half in zip(field.shape, halves)]
+
+    spectrum = np.fft.rfftn(field - centre, s=fft_shape)
+    if progress is not None:
+        progress.update()
+    ones = np.ones(field.shape)
+    for axis, kernel in enumerate(kernels):
+        shape = [1] * field.ndim
+        shape[axis] = -1
+        if axis == field.ndim - 1:
+            kernel_spectrum = np.fft.rfft(kernel, fft_shape[axis])
+        else:
+            kernel_spectrum = np.fft.fft(kernel, fft_shape[axis])
+        spectrum *= kernel_spectrum.reshape(shape)
+        ones = ones * _ones_convolution(field.shape[axis], kernel).reshape(shape)
+        if progress is not None:
+            progress.update()
+
+    full = np.fft.irfftn(spectrum, s=fft_shape)
+    if progress is not None:
+        progress.update()
+    convolved = full[tuple(slice(half, half + size) for size, half in zip(field.shape, halves))]
+
+    return convolved + centre * ones, ones
+
+
+def fft_array_averaging(inputed_field: np.ndarray, radius: int,
+                        out: np.ndarray = None, progress: Progress = None) -> np.ndarray:
+    """
+    Basic method of 2/3-Dimensional averaging done as fft convolution with box kernel.
+    Sum is divided by convolved ones-mask, which gives same border renormalization
+    as basic_*_array_averaging.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        radius (int): averaging radius around array point
+        out (NDArray): array to write result to, new one is allocated if None
+        progress (Progress): updated by stages done, see _fft_steps
+    Returns:
+        NDArray: peasantly averaged field
+    """
+    field = np.asarray(inputed_field)
+    kernel = np.ones(2 * radius + 1)
+    window_sum, window_size = _fft_separable_convolution(field, [kernel] * field.ndim,
+                                                         progress)
+    out = _prepare_out(out, field.shape, field_dtype(field))
+    return np.divide(window_sum, window_size, out=out, casting='same_kind')
 
 
 def init_gauss_window(sigma: int) -> Tuple[np.ndarray, float]:
@@ -358,7 +1284,102 @@ def average_horizontal_gauss_2d(copied_field: np.ndarray, window: np.ndarray, wi
         copied_field[y][i] = temp_horizontal[i]
 
 
-def average_3d_by_gauss(in_field: np.ndarray, sigma: int) -> np.ndarray:
+@njit(["void(float64[::1], float64[::1], float64[::1], float64, int64)",
+       "void(float64[:], float64[:], float64[:], float64, int64)"], nogil=True, cache=True)
+def _gauss_convolve_line(line: np.ndarray, result: np.ndarray, window: np.ndarray,
+                         window_sum: float, window_size: int):
+    """
+    Convolves contiguous line with gauss window the same way average_*_gauss_* do:
+    samples outside the line count as zeros, sum is divided by full window_sum
+    """
+    length = line.shape[0]
+    for index in range(length):
+        start = max(0, index - window_size)
+        end = min(length - 1, index + window_size)
+        temp_elem = 0.0
+        for temp_index in range(start, end + 1):
+            temp_elem += line[temp_index] * window[temp_index - index + window_size]
+        result[index] = temp_elem / window_sum
+
+
+@njit(_field_signatures("void({f}[:, :, ::1], float64[::1], float64, int64, float64[:, :, ::1], "
+                        "int64, int64, none, none)",
+                        "void({f}[:, :, ::1], float64[::1], float64, int64, float64[:, :, ::1], "
+                        "int64, int64, none, float64[:, ::1])",
+                        "void({f}[:, :, ::1], float64[::1], float64, int64, float64[:, :, ::1], "
+                        "int64, int64, {f}[:, :, ::1], float64[:, ::1])",
+                        "void({f}[:, :, ::1], float64[::1], float64, int64, float64[:, :, ::1], "
+                        "int64, int64, Array({f}, 3, 'A', readonly=True), float64[:, ::1])"),
+      parallel=True, cache=True)
+def _gauss_axis_parallel(copied_field: np.ndarray, window: np.ndarray, window_sum: float,
+                         window_size: int, line_buffers: np.ndarray, start: int, end: int,
+                         reference: np.ndarray = None, residuals: np.ndarray = None):
+    """
+    Gauss pass along middle axis of (outer, length, inner) field, in place, over lines
+    start to end (exclusive) numbered outer-major. Lines are split in contiguous
+    ranges between chunks running in parallel, every chunk copies its line into
+    own contiguous buffer before convolving.
+    Args:
+        copied_field (np.ndarray): field averaged in place
+        window (np.ndarray): gauss window from init_gauss_window
+        window_sum (float): sum of window elements
+        window_size (int): half size of window
+        line_buffers (np.ndarray): scratch of shape (chunks, 2, line length or more)
+        start (int): first line to average
+        end (int): line to stop before
+        reference (np.ndarray): field of the same shape to track change from, if given
+        residuals (np.ndarray): (chunks, 2) float64 change accumulated by every chunk
+    """
+    outer, length, inner = copied_field.shape
+    lines = end - start
+    chunks = line_buffers.shape[0]
+    for chunk in prange(chunks):
+        line = line_buffers[chunk, 0, :length]
+        result = line_buffers[chunk, 1, :length]
+        for line_index in range(start + chunk * lines // chunks,
+                                start + (chunk + 1) * lines // chunks):
+            o = line_index // inner
+            c = line_index % inner
+            for i in range(length):
+                line[i] = copied_field[o, i, c]
+            _gauss_convolve_line(line, result, window, window_sum, window_size)
+            for i in range(length):
+                copied_field[o, i, c] = result[i]
+            if reference is not None:
+                for i in range(length):
+                    change = abs(result[i] - reference[o, i, c])
+                    residuals[chunk, 0] = max(residuals[chunk, 0], change)
+                    residuals[chunk, 1] += change * change
+
+
+def average_gauss_axis_parallel(copied_field: np.ndarray, axis: int, window: np.ndarray,
+                                window_sum: float, window_size: int,
+                                line_buffers: np.ndarray, reference: np.ndarray = None,
+                                residuals: np.ndarray = None, progress: Progress = None):
+    """
+    Compiled average_*_gauss_* pass applied to every line along axis at once.
+    Args:
+        copied_field (np.ndarray): contiguous field averaged in place
+        axis (int): axis to average along, last one is horizontal
+        window (np.ndarray): gauss window from init_gauss_window
+        window_sum (float): sum of window elements
+        window_size (int): half size of window
+        line_buffers (np.ndarray): scratch of shape (chunks, 2, line length or more),
+                                   lines are split between chunks running in parallel
+        reference (np.ndarray): field to track change from, see _gauss_axis_parallel
+        residuals (np.ndarray): (chunks, 2) float64 change accumulated by every chunk
+        progress (Progress): updated by lines averaged, if given
+    """
+    shape = _axis_lines_shape(copied_field.shape, axis)
+    for start, end in _line_steps(shape[0] * shape[2], progress):
+        _gauss_axis_parallel(copied_field.reshape(shape), window, window_sum, window_size,
+                             line_buffers, start, end, _reshape_reference(reference, shape),
+                             residuals)
+        if progress is not None:
+            progress.update(end - start)
+
+
+def average_3d_by_gauss(in_field: np.ndarray, sigma: int, out: np.ndarray = None) -> np.ndarray:
     """
     Gauss method of 3-Dimensional averaging going line-by-line
     and doesnt take care of the border.
@@ -367,12 +1388,14 @@ def average_3d_by_gauss(in_field: np.ndarray, sigma: int) -> np.ndarray:
         inputed_field (NDArray): field to get averaged
         sigma (int): defines the degree of averaging and size of window kernel,
                      which we impose on field by support functions like hor_aver, ver_aver and etc
+        out (NDArray): array to write result to, new one is allocated if None
     Returns:
         NDArray: new averaged 3d field
     """
     depth, height, width = in_field.shape
 
-    copied_field = in_field.copy()
+    copied_field = _prepare_out(out, in_field.shape, field_dtype(in_field))
+    copied_field[...] = in_field
 
     window, window_sum = init_gauss_window(sigma)
     window_size = int(np.ceil(3 * sigma))
@@ -395,7 +1418,7 @@ def average_3d_by_gauss(in_field: np.ndarray, sigma: int) -> np.ndarray:
     return copied_field
 
 
-def average_2d_by_gauss(in_field, sigma) -> np.ndarray:
+def average_2d_by_gauss(in_field, sigma, out: np.ndarray = None) -> np.ndarray:
     """
     Gauss method of 2-Dimensional averaging going line-by-line
     and doesnt take care of the border.
@@ -404,12 +1427,14 @@ def average_2d_by_gauss(in_field, sigma) -> np.ndarray:
         inputed_field (NDArray): field to get averaged
         sigma (int): defines the degree of averaging and size of window kernel,
                      which we impose on field
+        out (NDArray): array to write result to, new one is allocated if None
     Returns:
         NDArray: new averaged 2d field
     """
     height, width = in_field.shape
 
-    copied_field = in_field.copy()
+    copied_field = _prepare_out(out, in_field.shape, field_dtype(in_field))
+    copied_field[...] = in_field
 
     window, window_sum = init_gauss_window(sigma)
     window_size = int(np.ceil(3 * sigma))
@@ -425,68 +1450,1109 @@ def average_2d_by_gauss(in_field, sigma) -> np.ndarray:
     return copied_field
 
 
+def _gauss_line_buffers(shape: tuple, workspace: Workspace = None) -> np.ndarray:
+    chunks = get_num_threads()
+    if workspace is None:
+        return np.empty((chunks, 2, max(shape)))
+    return workspace.get("gauss_lines", (chunks, 2, max(shape)))
+
+
+def _gauss_residuals(line_buffers: np.ndarray, residual: np.ndarray,
+                     workspace: Workspace = None) -> np.ndarray:
+    """Zeroed per-chunk residuals for the last gauss pass, None if change isnt tracked"""
+    if residual is None:
+        return None
+    if workspace is None:
+        return np.zeros((line_buffers.shape[0], 2))
+    residuals = workspace.get("gauss_residuals", (line_buffers.shape[0], 2))
+    residuals[...] = 0
+    return residuals
+
+
+def _reference_of(in_field: np.ndarray, residuals: np.ndarray) -> np.ndarray:
+    # in dtype of averaged field, which is what compiled passes are typed for
+    if residuals is None:
+        return None
+    return np.ascontiguousarray(in_field, dtype=field_dtype(in_field))
+
+
+def _reshape_reference(reference: np.ndarray, shape: tuple) -> np.ndarray:
+    return None if reference is None else reference.reshape(shape)
+
+
+def _axis_lines_shape(shape: tuple, axis: int) -> tuple:
+    """(outer, length, inner) shape viewing field of shape as lines along axis"""
+    return int(np.prod(shape[:axis])), shape[axis], int(np.prod(shape[axis + 1:]))
+
+
+def _line_steps(lines: int, progress: Progress) -> list:
+    """Line ranges compiled pass runs in: all lines at once without progress,
+    PROGRESS_STEPS ranges with it"""
+    if progress is None:
+        return [(0, lines)]
+    return _split_ranges(lines, PROGRESS_STEPS)
+
+
+def average_3d_by_gauss_parallel(in_field: np.ndarray, sigma: int, out: np.ndarray = None,
+                                 workspace: Workspace = None, residual: np.ndarray = None,
+                                 progress: Progress = None) -> np.ndarray:
+    """
+    Compiled multi-core version of average_3d_by_gauss with the same result.
+    Change from in_field is tracked by the last pass, if residual is given.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        sigma (int): defines the degree of averaging and size of window kernel
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): line buffers to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm
+        progress (Progress): updated by lines averaged, see _lines_number
+    Returns:
+        NDArray: new averaged 3d field
+    """
+    copied_field = _prepare_out(out, np.shape(in_field), field_dtype(in_field))
+    copied_field[...] = in_field
+    line_buffers = _gauss_line_buffers(copied_field.shape, workspace)
+    residuals = _gauss_residuals(line_buffers, residual, workspace)
+
+    window, window_sum = init_gauss_window(sigma)
+    window_size = int(np.ceil(3 * sigma))
+
+    # same order of passes as average_3d_by_gauss: x first, depth last
+    average_gauss_axis_parallel(copied_field, 2, window, window_sum, window_size, line_buffers,
+                                progress=progress)
+    average_gauss_axis_parallel(copied_field, 1, window, window_sum, window_size, line_buffers,
+                                progress=progress)
+    average_gauss_axis_parallel(copied_field, 0, window, window_sum, window_size, line_buffers,
+                                _reference_of(in_field, residuals), residuals, progress)
+    if residuals is not None:
+        _merge_residuals(residual, residuals)
+
+    return copied_field
+
+
+def average_2d_by_gauss_parallel(in_field: np.ndarray, sigma: int, out: np.ndarray = None,
+                                 workspace: Workspace = None, residual: np.ndarray = None,
+                                 progress: Progress = None) -> np.ndarray:
+    """
+    Compiled multi-core version of average_2d_by_gauss with the same result.
+    Change from in_field is tracked by the last pass, if residual is given.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        sigma (int): defines the degree of averaging and size of window kernel
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): line buffers to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm
+        progress (Progress): updated by lines averaged, see _lines_number
+    Returns:
+        NDArray: new averaged 2d field
+    """
+    copied_field = _prepare_out(out, np.shape(in_field), field_dtype(in_field))
+    copied_field[...] = in_field
+    line_buffers = _gauss_line_buffers(copied_field.shape, workspace)
+    residuals = _gauss_residuals(line_buffers, residual, workspace)
+
+    window, window_sum = init_gauss_window(sigma)
+    window_size = int(np.ceil(3 * sigma))
+
+    average_gauss_axis_parallel(copied_field, 1, window, window_sum, window_size, line_buffers,
+                                progress=progress)
+    average_gauss_axis_parallel(copied_field, 0, window, window_sum, window_size, line_buffers,
+                                _reference_of(in_field, residuals), residuals, progress)
+    if residuals is not None:
+        _merge_residuals(residual, residuals)
+
+    return copied_field
+
+
+def average_by_gauss_fft(in_field: np.ndarray, sigma: int,
+                         out: np.ndarray = None, progress: Progress = None) -> np.ndarray:
+    """
+    Gauss method of 2/3-Dimensional averaging done as fft convolution.
+    Gives same result as average_*_by_gauss: field is zero-padded and
+    divided by full window_sum for every axis.
+    Args:
+        in_field (NDArray): field to get averaged
+        sigma (int): defines the degree of averaging and size of window kernel
+        out (NDArray): array to write result to, new one is allocated if None
+        progress (Progress): updated by stages done, see _fft_steps
+    Returns:
+        NDArray: new averaged field
+    """
+    field = np.asarray(in_field)
+    window, window_sum = init_gauss_window(sigma)
+    convolved, _ = _fft_separable_convolution(field, [window] * field.ndim, progress)
+    out = _prepare_out(out, field.shape, field_dtype(field))
+    return np.divide(convolved, window_sum ** field.ndim, out=out, casting='same_kind')
+
+
+def recursive_gauss_coefficients(sigma: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Young - van Vliet coefficients of recursive gauss filter
+    w[n] = b * x[n] + a1 * w[n - 1] + a2 * w[n - 2] + a3 * w[n - 3], run forward and
+    then backward, plus 3x3 matrix giving backward initial state from last three
+    forward values, so line is treated as zero-padded (Triggs - Sdika boundary).
+    The matrix is found by running both filters over the zero tail once per sigma.
+    Args:
+        sigma (float): gauss sigma, not less than 0.5
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (b, a1, a2, a3) and boundary matrix
+    """
+    if sigma < 0.5:
+        raise ValueError("Recursive gauss needs sigma >= 0.5")
+
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1 - 0.26891 * sigma)
+
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    a1 = (2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3) / b0
+    a2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3) / b0
+    a3 = 0.422205 * q ** 3 / b0
+    b = 1 - (a1 + a2 + a3)
+    coefficients = np.array([b, a1, a2, a3])
+
+    # tail long enough for the slowest pole to decay below float64 resolution
+    pole = np.max(np.abs(np.roots([1, -a1, -a2, -a3])))
+    tail = int(np.ceil(np.log(1e-17) / np.log(pole))) + 3
+
+    boundary = np.zeros((3, 3))
+    for k in range(3):
+        state = [0.0, 0.0, 0.0]
+        state[k] = 1.0
+        forward = np.zeros(tail)
+        for n in range(tail):
+            forward[n] = a1 * state[0] + a2 * state[1] + a3 * state[2]
+            state = [forward[n], state[0], state[1]]
+
+        state = [0.0, 0.0, 0.0]
+        backward = np.zeros(tail)
+        for n in range(tail - 1, -1, -1):
+            backward[n] = b * forward[n] + a1 * state[0] + a2 * state[1] + a3 * state[2]
+            state = [backward[n], state[0], state[1]]
+        boundary[:, k] = backward[:3]
+
+    return coefficients, boundary
+
+
+@njit(["void(float64[::1], float64[::1], float64[::1], float64[:, ::1], float64, float64, "
+       "float64)",
+       "void(float64[:], float64[:], float64[:], float64[:, :], float64, float64, float64)"],
+      nogil=True, cache=True)
+def _recursive_gauss_line(line: np.ndarray, result: np.ndarray, coefficients: np.ndarray,
+                          boundary: np.ndarray, kernel_sum: float, centre_weight: float,
+                          window_sum: float):
+    """
+    Recursive approximation of _gauss_convolve_line: per-sample cost doesnt depend
+    on sigma. Gauss part is scaled to sum of truncated window and the extra centre
+    weight of init_gauss_window is added separately, so result approximates
+    the windowed filter, not a pure gauss.
+    """
+    length = line.shape[0]
+    b = coefficients[0]
+    a1 = coefficients[1]
+    a2 = coefficients[2]
+    a3 = coefficients[3]
+
+    w1 = 0.0
+    w2 = 0.0
+    w3 = 0.0
+    for n in range(length):
+        w = b * line[n] + a1 * w1 + a2 * w2 + a3 * w3
+        result[n] = w
+        w3 = w2
+        w2 = w1
+        w1 = w
+
+    y1 = boundary[0, 0] * w1 + boundary[0, 1] * w2 + boundary[0, 2] * w3
+    y2 = boundary[1, 0] * w1 + boundary[1, 1] * w2 + boundary[1, 2] * w3
+    y3 = boundary[2, 0] * w1 + boundary[2, 1] * w2 + boundary[2, 2] * w3
+    for n in range(length - 1, -1, -1):
+        y = b * result[n] + a1 * y1 + a2 * y2 + a3 * y3
+        y3 = y2
+        y2 = y1
+        y1 = y
+        result[n] = (kernel_sum * y + centre_weight * line[n]) / window_sum
+
+
+@njit(_field_signatures("void({f}[:, :, ::1], float64[::1], float64[:, ::1], float64, float64, "
+                        "float64, float64[:, :, ::1], int64, int64, none, none)",
+                        "void({f}[:, :, ::1], float64[::1], float64[:, ::1], float64, float64, "
+                        "float64, float64[:, :, ::1], int64, int64, none, float64[:, ::1])",
+                        "void({f}[:, :, ::1], float64[::1], float64[:, ::1], float64, float64, "
+                        "float64, float64[:, :, ::1], int64, int64, {f}[:, :, ::1], "
+                        "float64[:, ::1])",
+                        "void({f}[:, :, ::1], float64[::1], float64[:, ::1], float64, float64, "
+                        "float64, float64[:, :, ::1], int64, int64, "
+                        "Array({f}, 3, 'A', readonly=True), float64[:, ::1])"),
+      parallel=True, cache=True)
+def _recursive_gauss_axis_parallel(copied_field: np.ndarray, coefficients: np.ndarray,
+                                   boundary: np.ndarray, kernel_sum: float,
+                                   centre_weight: float, window_sum: float,
+                                   line_buffers: np.ndarray, start: int, end: int,
+                                   reference: np.ndarray = None, residuals: np.ndarray = None):
+    """
+    Recursive gauss pass along middle axis of (outer, length, inner) field, in place.
+    Lines are chosen and split and change is tracked the same way _gauss_axis_parallel does.
+    """
+    outer, length, inner = copied_field.shape
+    lines = end - start
+    chunks = line_buffers.shape[0]
+    for chunk in prange(chunks):
+        line = line_buffers[chunk, 0, :length]
+        result = line_buffers[chunk, 1, :length]
+        for line_index in range(start + chunk * lines // chunks,
+                                start + (chunk + 1) * lines // chunks):
+            o = line_index // inner
+            c = line_index % inner
+            for i in range(length):
+                line[i] = copied_field[o, i, c]
+            _recursive_gauss_line(line, result, coefficients, boundary, kernel_sum,
+                                  centre_weight, window_sum)
+            for i in range(length):
+                copied_field[o, i, c] = result[i]
+            if reference is not None:
+                for i in range(length):
+                    change = abs(result[i] - reference[o, i, c])
+                    residuals[chunk, 0] = max(residuals[chunk, 0], change)
+                    residuals[chunk, 1] += change * change
+
+
+def _recursive_gauss_passes(copied_field: np.ndarray, sigma: int, line_buffers: np.ndarray,
+                            axes: tuple, reference: np.ndarray = None,
+                            residuals: np.ndarray = None, progress: Progress = None):
+    coefficients, boundary = recursive_gauss_coefficients(sigma)
+    window, window_sum = init_gauss_window(sigma)
+    # init_gauss_window puts 1 in the centre instead of gauss value there
+    centre_weight = 1 - 1 / (np.sqrt(2 * np.pi) * sigma)
+    kernel_sum = window_sum - centre_weight
+
+    for index, axis in enumerate(axes):
+        shape = _axis_lines_shape(copied_field.shape, axis)
+        last = index == len(axes) - 1
+        for start, end in _line_steps(shape[0] * shape[2], progress):
+            _recursive_gauss_axis_parallel(copied_field.reshape(shape), coefficients, boundary,
+                                           kernel_sum, centre_weight, window_sum, line_buffers,
+                                           start, end,
+                                           _reshape_reference(reference if last else None,
+                                                              shape), residuals)
+            if progress is not None:
+                progress.update(end - start)
+
+
+def average_by_gauss_recursive(in_field: np.ndarray, sigma: int, out: np.ndarray = None,
+                               workspace: Workspace = None, residual: np.ndarray = None,
+                               progress: Progress = None) -> np.ndarray:
+    """
+    Gauss method of 2/3-Dimensional averaging with recursive (IIR) filter,
+    cost per point doesnt grow with sigma. Approximates average_*_by_gauss
+    within 6% of result maximum for sigma >= 2, including its zero-padded
+    borders and fields only few sigmas wide, and within about 2% away from
+    borders. Sigma 1 deviates up to 10%. Bounds are asserted by
+    benchmark.py --recursive.
+    Args:
+        in_field (NDArray): field to get averaged
+        sigma (int): defines the degree of averaging
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): line buffers to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm
+        progress (Progress): updated by lines averaged, see _lines_number
+    Returns:
+        NDArray: new averaged field
+    """
+    copied_field = _prepare_out(out, np.shape(in_field), field_dtype(in_field))
+    copied_field[...] = in_field
+    line_buffers = _gauss_line_buffers(copied_field.shape, workspace)
+    residuals = _gauss_residuals(line_buffers, residual, workspace)
+
+    # same order of passes as average_*_by_gauss: x first, depth last
+    _recursive_gauss_passes(copied_field, sigma, line_buffers,
+                            tuple(reversed(range(copied_field.ndim))),
+                            _reference_of(in_field, residuals), residuals, progress)
+    if residuals is not None:
+        _merge_residuals(residual, residuals)
+    return copied_field
+
+
+def _window_lengths(shape: tuple, half: int) -> int:
+    return int(np.sum([min(2 * half + 1, size) for size in shape]))
+
+
+def _fft_work(shape: tuple, half: int) -> float:
+    points = float(np.prod([_fft_size(size + 2 * half) for size in shape]))
+    return points * np.log2(max(2.0, points))
+
+
+# Work of one pass of every engine for field of given shape and kernel half size.
+# Multiplied by COST_MODEL coefficient it estimates time in seconds.
+COST_WORK = {
+    "basic": {
+        "separable": lambda shape, half: np.prod(shape) * len(shape),
+        "sat": lambda shape, half: np.prod(shape) * (2 ** len(shape) + len(shape)),
+        "fft": _fft_work,
+    },
+    "gauss": {
+        "parallel": lambda shape, half: np.prod(shape) * _window_lengths(shape, half),
+        "fft": _fft_work,
+    },
+}
+# 'recursive' gauss only approximates the windowed one, so it is never picked by 'auto'
+
+# Seconds per unit of COST_WORK, refit on host with calibrate_cost_model
+COST_MODEL = {
+    "basic": {"separable": 6e-9, "sat": 9e-9, "fft": 3e-9},
+    "gauss": {"parallel": 2.5e-9, "fft": 3.5e-9},
+}
+
+
+def choose_method(kind: str, shape: tuple, extent: int) -> str:
+    """
+    Picks cheapest engine for one averaging pass by COST_MODEL.
+    Args:
+        kind (str): 'basic' or 'gauss'
+        shape (tuple): field shape
+        extent (int): averaging radius for 'basic', sigma for 'gauss'
+    Returns:
+        str: method name for basic_array_averaging or gauss_array_averaging
+    """
+    half = extent if kind == "basic" else int(np.ceil(3 * extent))
+    costs = {method: COST_MODEL[kind][method] * work(tuple(shape), half)
+             for method, work in COST_WORK[kind].items()}
+    return min(costs, key=costs.get)
+
+
+def calibrate_cost_model(shape: tuple = (48, 48, 48), radius: int = 3, sigma: int = 2,
+                         repeats: int = 3, path: str = None) -> dict:
+    """
+    Times every engine considered by choose_method on random field and refits
+    COST_MODEL coefficients for this host. JIT warm-up is not timed.
+    Args:
+        shape (tuple): shape of calibration field
+        radius (int): radius used for basic engines
+        sigma (int): sigma used for gauss engines
+        repeats (int): best of how many runs is taken
+        path (str): if given, calibrated model is saved there as json
+    Returns:
+        dict: new COST_MODEL
+    """
+    field = np.random.default_rng(0).random(shape)
+    runs = {
+        "basic": (radius, radius, lambda method: basic_array_averaging(
+            field, radius, method=method, max_processes=1)),
+        "gauss": (sigma, int(np.ceil(3 * sigma)), lambda method: gauss_array_averaging(
+            field, sigma, method=method)),
+    }
+    for kind, (extent, half, run) in runs.items():
+        for method, work in COST_WORK[kind].items():
+            run(method)
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run(method)
+                best = min(best, time.perf_counter() - start)
+            COST_MODEL[kind][method] = float(best / work(tuple(shape), half))
+
+    if path is not None:
+        with open(path, "w") as file:
+            json.dump(COST_MODEL, file, indent=2)
+
+    return COST_MODEL
+
+
+def load_cost_model(path: str) -> dict:
+    """Loads COST_MODEL saved by calibrate_cost_model"""
+    with open(path) as file:
+        loaded = json.load(file)
+    for kind, coefficients in loaded.items():
+        COST_MODEL[kind].update(coefficients)
+    return COST_MODEL
+
+
+GAUSS_METHODS = ['auto', 'parallel', 'fft', 'recursive', 'python']
+
+
+@contextlib.contextmanager
+def _thread_limit(threads: int):
+    """Caps threads of compiled kernels inside, restoring previous number after.
+    None leaves numba threads as they are"""
+    if threads is None:
+        yield
+        return
+    previous = get_num_threads()
+    set_num_threads(max(1, min(threads, config.NUMBA_NUM_THREADS)))
+    try:
+        yield
+    finally:
+        set_num_threads(previous)
+
+
+def gauss_array_averaging(in_field: np.ndarray, sigma: int, method: str = 'auto',
+                          executor: AveragingExecutor = None, out: np.ndarray = None,
+                          workspace: Workspace = None, residual: np.ndarray = None,
+                          threads: int = None, visuals: bool = False) -> np.ndarray:
+    """
+    Runs one pass of gauss averaging on 2d or 3d field with chosen method.
+    Args:
+        in_field (NDArray): field to get averaged
+        sigma (int): defines the degree of averaging and size of window kernel
+        method (str): one of GAUSS_METHODS, 'auto' picks cheapest by COST_MODEL
+        executor (AveragingExecutor): accepted like by basic_array_averaging, gauss
+                                      engines run on numba threads
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): scratch to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm.
+                               Compiled and recursive engines track it while averaging,
+                               other ones make a separate pass
+        threads (int): caps threads of compiled kernels for this call, all if None
+        visuals (bool): enables progress bar verbose of compiled, recursive and fft engines
+    Returns:
+        NDArray: new averaged field
+    """
+    if method not in GAUSS_METHODS:
+        raise ValueError("Unknown gauss averaging method: " + str(method))
+
+    field = np.asarray(in_field)
+    if field.ndim not in [2, 3]:
+        raise ValueError("Only 2d and 3d fields can be averaged")
+
+    if method == 'auto':
+        method = choose_method("gauss", field.shape, sigma)
+
+    if method == 'fft':
+        total = _fft_steps(field.ndim)
+    else:
+        total = _lines_number(field.shape, range(field.ndim))
+    with _thread_limit(threads), _pass_progress(visuals and method != 'python',
+                                                total) as progress:
+        return _gauss_array_averaging(field, sigma, method, out, workspace, residual, progress)
+
+
+def _gauss_array_averaging(field: np.ndarray, sigma: int, method: str, out: np.ndarray,
+                           workspace: Workspace, residual: np.ndarray,
+                           progress: Progress) -> np.ndarray:
+    if method == 'recursive':
+        return average_by_gauss_recursive(field, sigma, out=out, workspace=workspace,
+                                          residual=residual, progress=progress)
+
+    if method == 'parallel':
+        if field.ndim == 2:
+            return average_2d_by_gauss_parallel(field, sigma, out=out, workspace=workspace,
+                                                residual=residual, progress=progress)
+        return average_3d_by_gauss_parallel(field, sigma, out=out, workspace=workspace,
+                                            residual=residual, progress=progress)
+
+    if method == 'fft':
+        result = average_by_gauss_fft(field, sigma, out=out, progress=progress)
+    elif field.ndim == 2:
+        result = average_2d_by_gauss(field, sigma, out=out)
+    else:
+        result = average_3d_by_gauss(field, sigma, out=out)
+    _residual_pass(field, result, residual)
+    return result
+
+
+BASIC_METHODS = ['auto', 'separable', 'direct', 'sat', 'fft']
+
+
+def basic_array_averaging(inputed_field: np.ndarray, radius: int, method: str = 'auto',
+                          max_processes: int = 4, visuals: bool = False,
+                          executor: AveragingExecutor = None, out: np.ndarray = None,
+                          workspace: Workspace = None,
+                          residual: np.ndarray = None) -> np.ndarray:
+    """
+    Runs one pass of basic averaging on 2d or 3d field with chosen method.
+    Args:
+        inputed_field (NDArray): field to get averaged
+        radius (int): averaging radius around array point
+        method (str): one of BASIC_METHODS, 'auto' picks cheapest by COST_MODEL
+        max_processes (int): maximum of processes ('direct') or threads ('separable') to use
+        visuals (bool): enables progress bar verbose
+        executor (AveragingExecutor): pool to reuse between calls
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): scratch to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change into, see residual_norm.
+                               Separable engine tracks it while averaging,
+                               other ones make a separate pass
+    Returns:
+        NDArray: peasantly averaged field
+    """
+    if method not in BASIC_METHODS:
+        raise ValueError("Unknown basic averaging method: " + str(method))
+
+    field = np.asarray(inputed_field)
+    if field.ndim not in [2, 3]:
+        raise ValueError("Only 2d and 3d fields can be averaged")
+
+    if method == 'auto':
+        method = choose_method("basic", field.shape, radius)
+
+    if method == 'separable':
+        with _pass_progress(visuals, _lines_number(field.shape, range(field.ndim))) as progress:
+            return separable_array_averaging(field, radius, max_threads=max_processes,
+                                             executor=executor, out=out, workspace=workspace,
+                                             residual=residual, progress=progress)
+
+    if method == 'fft':
+        with _pass_progress(visuals, _fft_steps(field.ndim)) as progress:
+            result = fft_array_averaging(field, radius, out=out, progress=progress)
+    elif method == 'sat':
+        with _pass_progress(visuals, _sat_steps(field.ndim)) as progress:
+            result = _sat_array_averaging(field, radius, out=out, progress=progress)
+    elif field.ndim == 2:
+        result = basic_2d_array_averaging_parallel(field, radius=radius,
+                                                   max_processes=max_processes,
+                                                   visuals=visuals, executor=executor, out=out)
+    else:
+        result = basic_3d_array_averaging_parallel(field, radius=radius,
+                                                   max_processes=max_processes,
+                                                   visuals=visuals, executor=executor, out=out)
+    _residual_pass(field, result, residual)
+    return result
+
+
+def iterate_averaging(in_field: np.ndarray, iterations_number: int, step,
+                      iterations_visuals: bool = False, tol: float = None,
+                      norm: str = 'max', history: list = None, shared: Workspace = None,
+                      **progress) -> np.ndarray:
+    """
+    Runs averaging step several times, alternating between two preallocated
+    fields: every iteration reads the previous result and writes into the other
+    buffer. Together with a Workspace this keeps iterations allocation-free,
+    and peak memory is two fields plus line scratch.
+    With tol given, iterations_number is the upper limit: every step also tracks
+    how much the field changed, and iterations stop once the change is below tol.
+    Args:
+        in_field (NDArray): field to get averaged, it is never written to
+        iterations_number (int): number of iterations, maximum one if tol is given
+        step (callable): step(source, out) writes one averaged pass of source into out,
+                         step(source, out, residual) also accumulates the change into
+                         residual when tol is given
+        iterations_visuals (bool): enables progress bar over iterations
+        tol (float): change to stop at, all iterations are done if None
+        norm (str): one of RESIDUAL_NORMS to measure change with
+        history (list): change of every done iteration is appended to it, if given
+        shared (Workspace): if given, the two buffers are its shared memory ones, which
+                            direct averaging workers read and write in place. Result is
+                            copied out and they are released before returning
+        progress: "desc" task name and other Progress arguments
+    Returns:
+        NDArray: averaged field, one of the two buffers unless shared is given
+    """
+    if norm not in RESIDUAL_NORMS:
+        raise ValueError("Unknown residual norm: " + str(norm))
+
+    result = np.asarray(in_field, dtype=field_dtype(in_field))
+    buffers = [None, None]
+    residual = np.zeros(2)
+
+    tracker = None
+    if iterations_visuals:
+        tracker = Progress(iterations_number, progress.pop("desc", "Iterations"), **progress)
+
+    try:
+        result = _iterate(result, iterations_number, step, buffers, residual, tracker,
+                          tol, norm, history, shared)
+        if shared is not None and any(buffer is result for buffer in buffers):
+            # the other buffer is freed first, so copying result out adds no third field
+            other = 1 - next(index for index, buffer in enumerate(buffers) if buffer is result)
+            buffers.clear()
+            shared.release_shared(f"iteration{other}")
+            result = result.copy()
+    finally:
+        if shared is not None:
+            buffers.clear()
+            shared.release_shared()
+    return result
+
+
+def _iterate(result: np.ndarray, iterations_number: int, step, buffers: list,
+             residual: np.ndarray, tracker: "Progress", tol: float, norm: str,
+             history: list, shared: Workspace) -> np.ndarray:
+    """Iterations of iterate_averaging, returns the last result"""
+    with tracker if tracker is not None else contextlib.nullcontext():
+        for iteration in range(iterations_number):
+            out = buffers[iteration % 2]
+            if out is None:
+                if shared is None:
+                    out = np.empty(result.shape, dtype=result.dtype)
+                else:
+                    out = shared.shared(f"iteration{iteration % 2}", result.shape, result.dtype)
+                buffers[iteration % 2] = out
+
+            if tol is None:
+                with profiling.span("iteration", iteration=iteration):
+                    step(result, out)
+                result = out
+                if tracker is not None:
+                    tracker.update()
+                continue
+
+            residual[...] = 0
+            with profiling.span("iteration", iteration=iteration):
+                step(result, out, residual)
+            result = out
+            change = residual_norm(residual, result.size, norm)
+            if history is not None:
+                history.append(change)
+            if tracker is not None:
+                tracker.update(residual=change)
+            if change < tol:
+                break
+
+    return result
+
+
+def _direct_workspace(method: str, shape: tuple, radius: int,
+                      workspace: Workspace) -> Workspace:
+    """workspace when basic averaging of shape runs direct engine, so iterate_averaging
+    keeps its buffers in shared memory for the workers, None otherwise"""
+    if method == 'auto':
+        method = choose_method("basic", tuple(shape), radius)
+    return workspace if method == 'direct' else None
+
+
 def basic_2d_averaging_iterations(in_field: np.ndarray, iterations_number: int = 1,
                                   radius: int = 1, processes: int = 1,
                                   iterations_visuals: bool = False,
                                   averaging_visuals: bool = False,
-                                  leave: bool = True) -> np.ndarray:
-    result = in_field
-    if iterations_visuals:
-        for i in tqdm(range(iterations_number), desc="⚊ Total Progress", position=1, leave=leave):
-            result = basic_2d_array_averaging_parallel(np.asarray(result), radius=radius,
-                                                       max_processes=processes,
-                                                       visuals=averaging_visuals)
-    else:
-        for i in range(iterations_number):
-            result = basic_2d_array_averaging_parallel(np.asarray(result), radius=radius,
-                                                       max_processes=processes,
-                                                       visuals=averaging_visuals)
-    return (result)
+                                  leave: bool = True, method: str = 'auto',
+                                  executor: AveragingExecutor = None, tol: float = None,
+                                  norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        basic_array_averaging(source, radius=radius, method=method, max_processes=processes,
+                              visuals=averaging_visuals, executor=executor, out=out,
+                              workspace=workspace, residual=residual)
+
+    return iterate_averaging(in_field, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             shared=_direct_workspace(method, np.shape(in_field), radius,
+                                                      workspace),
+                             desc="⚊ Total Progress", position=1, leave=leave)
 
 
 def gauss_2d_averaging_iterations(in_field: np.ndarray, iterations_number: int = 1, radius: int = 1,
                                   processes: int = 1, iterations_visuals: bool = False,
-                                  averaging_visuals: bool = False) -> np.ndarray:
-    result = in_field
-    if iterations_visuals:
-        for i in tqdm(range(iterations_number)):
-            result = average_2d_by_gauss(np.asarray(result), sigma=radius)
-    else:
-        for i in range(iterations_number):
-            result = average_2d_by_gauss(np.asarray(result), sigma=radius)
-    return (result)
+                                  averaging_visuals: bool = False, leave: bool = True,
+                                  method: str = 'auto',
+                                  executor: AveragingExecutor = None, tol: float = None,
+                                  norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        gauss_array_averaging(source, sigma=radius, method=method, executor=executor,
+                              out=out, workspace=workspace, residual=residual,
+                              threads=processes if processes > 1 else None,
+                              visuals=averaging_visuals)
+
+    return iterate_averaging(in_field, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             desc="⚊ Total Progress", position=1, leave=leave)
 
 
 def basic_3d_averaging_iterations(in_field: np.ndarray, iterations_number: int = 1,
                                   radius: int = 1, processes: int = 1,
                                   iterations_visuals: bool = False,
                                   averaging_visuals: bool = False,
-                                  leave: bool = True) -> np.ndarray:
-    result = in_field
-    if iterations_visuals:
-        for i in tqdm(range(iterations_number), desc="⚊ Total Progress", position=1, leave=leave):
-            result = basic_3d_array_averaging_parallel(np.asarray(result), radius=radius,
-                                                       max_processes=processes,
-                                                       visuals=averaging_visuals)
-    else:
-        for i in range(iterations_number):
-            result = basic_3d_array_averaging_parallel(np.asarray(result), radius=radius,
-                                                       max_processes=processes,
-                                                       visuals=averaging_visuals)
-    return (result)
+                                  leave: bool = True, method: str = 'auto',
+                                  executor: AveragingExecutor = None, tol: float = None,
+                                  norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        basic_array_averaging(source, radius=radius, method=method, max_processes=processes,
+                              visuals=averaging_visuals, executor=executor, out=out,
+                              workspace=workspace, residual=residual)
+
+    return iterate_averaging(in_field, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             shared=_direct_workspace(method, np.shape(in_field), radius,
+                                                      workspace),
+                             desc="⚊ Total Progress", position=1, leave=leave)
 
 
 def gauss_3d_averaging_iterations(in_field: np.ndarray, iterations_number: int = 1, radius: int = 1,
                                   processes: int = 1, iterations_visuals: bool = False,
-                                  averaging_visuals: bool = False) -> np.ndarray:
-    result = in_field
-    if iterations_visuals:
-        for i in tqdm(range(iterations_number)):
-            result = average_3d_by_gauss(np.asarray(result), sigma=radius)
-    else:
-        for i in range(iterations_number):
-            result = average_3d_by_gauss(np.asarray(result), sigma=radius)
-    return (result)
+                                  averaging_visuals: bool = False, leave: bool = True,
+                                  method: str = 'auto',
+                                  executor: AveragingExecutor = None, tol: float = None,
+                                  norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        gauss_array_averaging(source, sigma=radius, method=method, executor=executor,
+                              out=out, workspace=workspace, residual=residual,
+                              threads=processes if processes > 1 else None,
+                              visuals=averaging_visuals)
+
+    return iterate_averaging(in_field, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             desc="⚊ Total Progress", position=1, leave=leave)
+
+
+def _prepare_batch(in_fields: np.ndarray, out: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    fields = np.ascontiguousarray(in_fields, dtype=field_dtype(in_fields))
+    if fields.ndim not in [3, 4]:
+        raise ValueError("Only stacks of 2d and 3d fields can be averaged")
+    return fields, _prepare_out(out, fields.shape, fields.dtype)
+
+
+def basic_batch_averaging(in_fields: np.ndarray, radius: int, method: str = 'auto',
+                          max_processes: int = 4, visuals: bool = False,
+                          executor: AveragingExecutor = None, out: np.ndarray = None,
+                          workspace: Workspace = None,
+                          residual: np.ndarray = None) -> np.ndarray:
+    """
+    Runs one pass of basic averaging on several fields of the same shape, stacked
+    channel-outermost as (C, y, x) or (C, z, y, x). That is how columns are laid out
+    anyway, so stacking is a plain copy and every channel of result is a contiguous view.
+    Separable engine averages all channels in a single traversal per axis,
+    other engines go channel by channel.
+    Args:
+        in_fields (NDArray): stacked fields to get averaged
+        radius (int): averaging radius around array point
+        method (str): one of BASIC_METHODS, 'auto' picks cheapest by COST_MODEL
+        max_processes (int): maximum of processes ('direct') or threads ('separable') to use
+        visuals (bool): enables progress bar verbose
+        executor (AveragingExecutor): pool to reuse between calls
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): scratch to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change of all channels into
+    Returns:
+        NDArray: stacked peasantly averaged fields
+    """
+    if method not in BASIC_METHODS:
+        raise ValueError("Unknown basic averaging method: " + str(method))
+
+    fields, out = _prepare_batch(in_fields, out)
+    if method == 'auto':
+        method = choose_method("basic", fields.shape[1:], radius)
+
+    if method == 'separable':
+        axes = tuple(range(1, fields.ndim))
+        with _pass_progress(visuals, _lines_number(fields.shape, axes)) as progress:
+            return separable_array_averaging(fields, radius, max_threads=max_processes,
+                                             executor=executor, out=out, workspace=workspace,
+                                             axes=axes, residual=residual, progress=progress)
+
+    for channel in range(fields.shape[0]):
+        basic_array_averaging(fields[channel], radius, method=method,
+                              max_processes=max_processes, visuals=visuals,
+                              executor=executor, out=out[channel], workspace=workspace,
+                              residual=residual)
+    return out
+
+
+def gauss_batch_averaging(in_fields: np.ndarray, sigma: int, method: str = 'auto',
+                          executor: AveragingExecutor = None, out: np.ndarray = None,
+                          workspace: Workspace = None, residual: np.ndarray = None,
+                          threads: int = None, visuals: bool = False) -> np.ndarray:
+    """
+    Runs one pass of gauss averaging on several fields of the same shape, stacked
+    channel-outermost as (C, y, x) or (C, z, y, x). Compiled and recursive engines
+    average all channels in a single traversal per axis, other engines go channel
+    by channel.
+    Args:
+        in_fields (NDArray): stacked fields to get averaged
+        sigma (int): defines the degree of averaging and size of window kernel
+        method (str): one of GAUSS_METHODS, 'auto' picks cheapest by COST_MODEL
+        executor (AveragingExecutor): accepted like by basic_batch_averaging
+        out (NDArray): array to write result to, new one is allocated if None
+        workspace (Workspace): scratch to reuse between calls
+        residual (np.ndarray): float64 pair to accumulate change of all channels into
+        threads (int): caps threads of compiled kernels for this call, all if None
+        visuals (bool): enables progress bar verbose, see gauss_array_averaging
+    Returns:
+        NDArray: stacked new averaged fields
+    """
+    if method not in GAUSS_METHODS:
+        raise ValueError("Unknown gauss averaging method: " + str(method))
+
+    fields, out = _prepare_batch(in_fields, out)
+    if method == 'auto':
+        method = choose_method("gauss", fields.shape[1:], sigma)
+
+    if method not in ['parallel', 'recursive']:
+        for channel in range(fields.shape[0]):
+            gauss_array_averaging(fields[channel], sigma, method=method, executor=executor,
+                                  out=out[channel], workspace=workspace, residual=residual,
+                                  threads=threads, visuals=visuals)
+        return out
+
+    total = _lines_number(fields.shape, range(1, fields.ndim))
+    with _thread_limit(threads), _pass_progress(visuals, total) as progress:
+        return _gauss_batch_passes(fields, sigma, method, out, workspace, residual, progress)
+
+
+def _gauss_batch_passes(fields: np.ndarray, sigma: int, method: str, out: np.ndarray,
+                        workspace: Workspace, residual: np.ndarray,
+                        progress: Progress) -> np.ndarray:
+    """Compiled or recursive passes of gauss_batch_averaging over all channels at once"""
+    out[...] = fields
+    line_buffers = _gauss_line_buffers(fields.shape[1:], workspace)
+    residuals = _gauss_residuals(line_buffers, residual, workspace)
+    reference = _reference_of(fields, residuals)
+
+    if method == 'recursive':
+        _recursive_gauss_passes(out, sigma, line_buffers, tuple(reversed(range(1, fields.ndim))),
+                                reference, residuals, progress)
+        if residuals is not None:
+            _merge_residuals(residual, residuals)
+        return out
+
+    window, window_sum = init_gauss_window(sigma)
+    window_size = int(np.ceil(3 * sigma))
+
+    # same order of passes as average_*_by_gauss: x first, depth last
+    for axis in reversed(range(1, fields.ndim)):
+        average_gauss_axis_parallel(out, axis, window, window_sum, window_size, line_buffers,
+                                    reference if axis == 1 else None, residuals, progress)
+    if residuals is not None:
+        _merge_residuals(residual, residuals)
+
+    return out
+
+
+def basic_batch_averaging_iterations(in_fields: np.ndarray, iterations_number: int = 1,
+                                     radius: int = 1, processes: int = 1,
+                                     iterations_visuals: bool = False,
+                                     averaging_visuals: bool = False,
+                                     leave: bool = True, method: str = 'auto',
+                                     executor: AveragingExecutor = None, tol: float = None,
+                                     norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        basic_batch_averaging(source, radius=radius, method=method, max_processes=processes,
+                              visuals=averaging_visuals, executor=executor, out=out,
+                              workspace=workspace, residual=residual)
+
+    return iterate_averaging(in_fields, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             shared=_direct_workspace(method, np.shape(in_fields)[1:], radius,
+                                                      workspace),
+                             desc="⚊ Total Progress", position=1, leave=leave)
+
+
+def gauss_batch_averaging_iterations(in_fields: np.ndarray, iterations_number: int = 1,
+                                     radius: int = 1, processes: int = 1,
+                                     iterations_visuals: bool = False,
+                                     averaging_visuals: bool = False,
+                                     leave: bool = True, method: str = 'auto',
+                                     executor: AveragingExecutor = None, tol: float = None,
+                                     norm: str = 'max', history: list = None) -> np.ndarray:
+    workspace = Workspace()
+
+    def step(source: np.ndarray, out: np.ndarray, residual: np.ndarray = None):
+        gauss_batch_averaging(source, sigma=radius, method=method, executor=executor,
+                              out=out, workspace=workspace, residual=residual,
+                              threads=processes if processes > 1 else None,
+                              visuals=averaging_visuals)
+
+    return iterate_averaging(in_fields, iterations_number, step, iterations_visuals,
+                             tol=tol, norm=norm, history=history,
+                             desc="⚊ Total Progress", position=1, leave=leave)
+
+
+# slab sized arrays alive at once: mapped window, its copy, two iteration buffers
+# and engine scratch, fft keeps padded real and complex spectra
+OUT_OF_CORE_COPIES = {"basic": {"separable": 4, "direct": 4, "sat": 5, "fft": 9},
+                      "gauss": {"parallel": 4, "python": 4, "fft": 9}}
+
+
+def open_field(path: str, shape: tuple = None, dtype: np.dtype = None) -> np.ndarray:
+    """
+    Opens field on disk without reading it: .npy files are memory-mapped as they are,
+    anything else is treated as raw C-ordered binary of given shape and dtype.
+    Args:
+        path (str): .npy or raw binary file
+        shape (tuple): shape of raw field
+        dtype (np.dtype): dtype of raw field
+    Returns:
+        NDArray: read-only memory-mapped field
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    if shape is None or dtype is None:
+        raise ValueError("Shape and dtype are needed to open raw field " + path)
+    return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape))
+
+
+def _slab_window(field: np.memmap, start: int, end: int, mode: str = 'r') -> np.memmap:
+    """
+    Maps only layers start:end of memory-mapped field. Pages touched through a
+    window leave process memory together with it, unlike pages of whole field map.
+    """
+    layer = int(np.prod(field.shape[1:])) * field.dtype.itemsize
+    return np.memmap(field.filename, dtype=field.dtype, mode=mode,
+                     offset=field.offset + start * layer, shape=(end - start,) + field.shape[1:])
+
+
+def _halo_per_iteration(kind: str, extent: int) -> int:
+    """How far one pass spreads values along an axis"""
+    return extent if kind == "basic" else int(np.ceil(3 * extent))
+
+
+def plan_slabs(shape: tuple, itemsize: int, halo: int, copies: int,
+               memory_budget: int) -> int:
+    """
+    Depth of the biggest z-slab that fits memory_budget together with its halo
+    on both sides, when averaging keeps given number of slab copies resident.
+    Args:
+        shape (tuple): shape of field, slabs are cut along first axis
+        itemsize (int): bytes per field value
+        halo (int): layers needed from each neighbour slab
+        copies (int): number of slab sized arrays alive while slab is averaged
+        memory_budget (int): bytes available for them
+    Returns:
+        int: slab depth without halo
+    """
+    layer = int(np.prod(shape[1:])) * itemsize * copies
+    depth = memory_budget // layer - 2 * halo
+    if depth < 1:
+        raise ValueError(f"Memory budget of {memory_budget} bytes is too small "
+                         f"for slab with halo of {halo} layers")
+    return min(int(depth), shape[0])
+
+
+def out_of_core_averaging(in_path: str, out_path: str, extent: int, kind: str = "basic",
+                          method: str = "separable", iterations_number: int = 1,
+                          memory_budget: int = 2 ** 30, fused_iterations: int = None,
+                          shape: tuple = None, dtype: np.dtype = None,
+                          visuals: bool = False) -> np.ndarray:
+    """
+    Averages 2d or 3d field that doesnt fit in memory. Input is memory-mapped,
+    averaged in z-slabs carrying a halo of neighbour layers, and every slab core
+    is written into memory-mapped .npy output, so at most memory_budget bytes of
+    slabs are resident. Each sweep over the field runs fused_iterations in memory
+    on every slab with a halo wide enough for all of them, longer runs go
+    through several sweeps ping-ponging between output and a temporary file
+    next to it. Result is the same as of in-memory averaging.
+    Args:
+        in_path (str): .npy or raw binary field, see open_field
+        out_path (str): .npy file to write result to
+        extent (int): radius for 'basic' kind, sigma for 'gauss' one
+        kind (str): 'basic' or 'gauss'
+        method (str): engine from BASIC_METHODS or GAUSS_METHODS, except 'auto'
+                      and 'recursive', which needs whole lines
+        iterations_number (int): number of iterations
+        memory_budget (int): bytes of slabs allowed to be resident at once
+        fused_iterations (int): iterations done per sweep, as many as budget
+                                allows while halo stays below slab depth if None
+        shape (tuple): shape of raw input
+        dtype (np.dtype): dtype of raw input
+        visuals (bool): enables progress bar over slabs
+    Returns:
+        NDArray: memory-mapped averaged field
+    """
+    if kind not in OUT_OF_CORE_COPIES or method not in OUT_OF_CORE_COPIES[kind]:
+        raise ValueError(f"Unsupported out of core averaging: {kind} {method}")
+
+    source = open_field(in_path, shape, dtype)
+    if source.ndim not in [2, 3]:
+        raise ValueError("Only 2d and 3d fields can be averaged")
+    if not source.flags.c_contiguous:
+        raise ValueError("Only C-ordered fields can be averaged out of core")
+    dtype = field_dtype(source)
+    copies = OUT_OF_CORE_COPIES[kind][method]
+    halo = _halo_per_iteration(kind, extent)
+
+    if fused_iterations is None:
+        # most iterations whose halo doesnt cost more than the slab itself
+        fused_iterations = 1
+        for candidate in range(iterations_number, 1, -1):
+            try:
+                depth = plan_slabs(source.shape, dtype.itemsize, halo * candidate, copies,
+                                   memory_budget)
+            except ValueError:
+                continue
+            if depth == source.shape[0] or depth >= 2 * halo * candidate:
+                fused_iterations = candidate
+                break
+    depth = plan_slabs(source.shape, dtype.itemsize, halo * fused_iterations, copies,
+                       memory_budget)
+
+    workspace = Workspace()
+
+    def step(field: np.ndarray, out: np.ndarray):
+        if kind == "basic":
+            basic_array_averaging(field, extent, method=method, out=out, workspace=workspace)
+        else:
+            gauss_array_averaging(field, extent, method=method, out=out, workspace=workspace)
+
+    sweeps = -(-iterations_number // fused_iterations)
+    output = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=source.shape)
+    temporary_path = out_path[:-len(".npy")] + ".tmp.npy" if out_path.endswith(".npy") \
+        else out_path + ".tmp.npy"
+    temporary = None
+    if sweeps > 1:
+        temporary = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=dtype,
+                                              shape=source.shape)
+
+    try:
+        done = 0
+        for sweep in range(sweeps):
+            # last sweep has to end in output
+            target = output if (sweeps - 1 - sweep) % 2 == 0 else temporary
+            iterations = min(fused_iterations, iterations_number - done)
+            reach = halo * iterations
+
+            slabs = range(0, source.shape[0], depth)
+            tracker = Progress(len(slabs), f"Sweep {sweep + 1}/{sweeps}") if visuals else None
+            with tracker if tracker is not None else contextlib.nullcontext():
+                for start in slabs:
+                    end = min(start + depth, source.shape[0])
+                    low, high = max(0, start - reach), min(source.shape[0], end + reach)
+                    with profiling.span("slab", sweep=sweep, start=start, end=end):
+                        window = _slab_window(source, low, high)
+                        slab = np.array(window, dtype=dtype)
+                        del window
+                        result = iterate_averaging(slab, iterations, step)
+
+                        window = _slab_window(target, start, end, 'r+')
+                        window[...] = result[start - low:end - low]
+                        window.flush()
+                    # drop slab and its result before the next one is read
+                    del window, slab, result
+                    if tracker is not None:
+                        tracker.update()
+
+            source = target
+            done += iterations
+    finally:
+        if temporary is not None:
+            del temporary
+            os.remove(temporary_path)
+
+    return output
+
+
+def precompile():
+    """
+    Compiles every kernel for every dtype of FIELD_DTYPES and 2d and 3d fields,
+    with and without tracked residual, so the on-disk numba cache next to this
+    module (or in NUMBA_CACHE_DIR) is filled and later runs and pool workers
+    load kernels instead of compiling them. Every kernel has eager signatures
+    for the array layouts and optional arguments engines pass, so they are
+    compiled when module is imported, running engines on small fields here
+    checks every call matches one of them.
+    """
+    for dtype in FIELD_DTYPES:
+        for shape in [(6, 5), (6, 5, 4)]:
+            field = np.random.default_rng(0).random(shape).astype(dtype)
+            for residual in [None, np.zeros(2)]:
+                # two threads split outer axis of some passes and inner one of others
+                for threads in [1, 2]:
+                    basic_array_averaging(field, 1, 'separable', max_processes=threads,
+                                          residual=residual)
+                basic_array_averaging(field, 1, 'sat', residual=residual)
+                for method in ['parallel', 'recursive']:
+                    gauss_array_averaging(field, 1, method, residual=residual)
+                basic_batch_averaging(np.stack([field, field]), 1, 'separable',
+                                      residual=residual)
+                gauss_batch_averaging(np.stack([field, field]), 1, 'parallel',
+                                      residual=residual)
 
 
 def test():
@@ -1,7 +1,13 @@
 from numba import cuda
 
+# kernels are compiled for both storage precisions, sums are accumulated in float64
+SIGNATURES_3D = ['void(float32[:, :, :], float32[:, :, :], int32)',
+                 'void(float64[:, :, :], float64[:, :, :], int32)']
+SIGNATURES_2D = ['void(float32[:, :], float32[:, :], int32)',
+                 'void(float64[:, :], float64[:, :], int32)']
 
-@cuda.jit('float64[:, :, :], int32, int32, int32, int32', device=True)
+
+@cuda.jit(device=True)
 def cuda_average_this_3d_point(input_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                radius: int, i: int, j: int, k: int):
     """
@@ -35,7 +41,7 @@ def cuda_average_this_3d_point(input_array: cuda.cudadrv.devicearray.DeviceNDArr
     return sum_val / count
 
 
-@cuda.jit('void(float64[:, :, :], float64[:, :, :], int32)')
+@cuda.jit(SIGNATURES_3D)
 def cuda_kernel_field_average_3d(input_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                  output_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                  radius: int):
@@ -83,7 +89,7 @@ def cuda_basic_3d_array_averaging(input_array_gpu: cuda.cudadrv.devicearray.Devi
     return output_array_gpu
 
 
-@cuda.jit('float64[:, :], int32, int32, int32', device=True)
+@cuda.jit(device=True)
 def cuda_average_this_2d_point(input_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                radius: int, i: int, j: int):
     """
@@ -113,7 +119,7 @@ def cuda_average_this_2d_point(input_array: cuda.cudadrv.devicearray.DeviceNDArr
     return sum_val / count
 
 
-@cuda.jit('void(float64[:, :], float64[:, :], int32)')
+@cuda.jit(SIGNATURES_2D)
 def cuda_kernel_field_average_2d(input_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                  output_array: cuda.cudadrv.devicearray.DeviceNDArray,
                                  radius: int):
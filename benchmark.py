@@ -0,0 +1,616 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import averager
+import profiling
+import structures
+
+SUITE_PYTHON_LIMIT = 2 ** 15  # field elements, bigger fields skip engines looping in python
+
+
+def time_call(func, *args, repeats: int = 1, **kwargs) -> float:
+    """Returns best wall time of several calls of func in seconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare_gauss(shape: tuple, sigma: int, repeats: int = 1) -> dict:
+    """
+    Times python and compiled gauss averaging on random field of given shape.
+    Compiled version is called once on small field beforehand, so JIT time is excluded
+    """
+    field = np.random.default_rng(0).random(shape)
+    warmup = np.random.default_rng(0).random(tuple(4 for _ in shape))
+    averager.gauss_array_averaging(warmup, sigma, method='parallel')
+
+    python_time = time_call(averager.gauss_array_averaging, field, sigma,
+                            method='python', repeats=repeats)
+    parallel_time = time_call(averager.gauss_array_averaging, field, sigma,
+                              method='parallel', repeats=repeats)
+
+    return {"shape": shape, "sigma": sigma, "python": python_time,
+            "parallel": parallel_time, "speedup": python_time / parallel_time}
+
+
+# max relative deviation of float32 result from float64 one for every engine, a few
+# float32 epsilons: engines sum in float64 and round to float32 only between passes
+PRECISION_TOLERANCES = {"basic_separable": 1e-6, "basic_sat": 1e-6, "basic_fft": 1e-6,
+                        "gauss_parallel": 1e-6, "gauss_fft": 1e-6}
+
+
+def compare_precision(shape: tuple, radius: int, sigma: int, iterations: int = 1) -> dict:
+    """
+    Averages the same random field in float32 and float64 with every engine
+    and returns max relative deviation of float32 result from float64 one.
+    Asserts deviations fit PRECISION_TOLERANCES
+    """
+    field = np.random.default_rng(0).normal(1.0, 0.1, shape)
+    runs = [("basic", method, averager.basic_array_averaging, radius)
+            for method in ["separable", "sat", "fft"]]
+    runs += [("gauss", method, averager.gauss_array_averaging, sigma)
+             for method in ["parallel", "fft"]]
+
+    deviations = {}
+    for kind, method, func, extent in runs:
+        def step(source, out):
+            func(source, extent, method=method, out=out)
+
+        single = averager.iterate_averaging(field.astype(np.float32), iterations, step)
+        double = averager.iterate_averaging(field, iterations, step)
+        name = kind + "_" + method
+        deviations[name] = float(np.max(np.abs(single - double) / np.abs(double)))
+        assert deviations[name] <= PRECISION_TOLERANCES[name], \
+            f"float32 {name} deviates {deviations[name]:.2e}, " \
+            f"tolerance {PRECISION_TOLERANCES[name]:.2e}"
+    return deviations
+
+
+# max deviation of recursive gauss from windowed one related to max of windowed result,
+# borders included, for sigma 1 and for bigger sigmas
+RECURSIVE_GAUSS_BOUNDS = {1: 0.1, 2: 0.06}
+RECURSIVE_GAUSS_SMALL = (5, 6, 8)  # field shape mostly made of borders, checked by --recursive
+
+
+def compare_recursive_gauss(shape: tuple, sigmas: list, repeats: int = 1) -> list:
+    """
+    Compares recursive gauss with windowed compiled one on random and smooth fields:
+    max deviation related to max of windowed result and time of both engines.
+    Asserts deviations fit RECURSIVE_GAUSS_BOUNDS
+    """
+    rng = np.random.default_rng(0)
+    grids = np.meshgrid(*[np.linspace(0, 2 * np.pi, size) for size in shape], indexing='ij')
+    fields = {"random": rng.random(shape), "smooth": 1 + np.prod(np.sin(grids), axis=0)}
+    warmup = rng.random(tuple(8 for _ in shape))
+    for method in ["parallel", "recursive"]:
+        averager.gauss_array_averaging(warmup, 1, method=method)
+
+    results = []
+    for sigma in sigmas:
+        result = {"sigma": sigma}
+        for name, field in fields.items():
+            windowed = averager.gauss_array_averaging(field, sigma, method='parallel')
+            recursive = averager.gauss_array_averaging(field, sigma, method='recursive')
+            result[name] = float(np.max(np.abs(recursive - windowed)) / np.max(np.abs(windowed)))
+            bound = RECURSIVE_GAUSS_BOUNDS[min(sigma, 2)]
+            assert result[name] <= bound, \
+                f"recursive gauss of {name} {shape} field sigma={sigma} deviates " \
+                f"{result[name]:.2e}, bound {bound:.2e}"
+        for method in ["parallel", "recursive"]:
+            result[method] = time_call(averager.gauss_array_averaging, fields["random"], sigma,
+                                       method=method, repeats=repeats)
+        results.append(result)
+    return results
+
+
+def compare_out_of_core(shape: tuple, radius: int, iterations: int, memory_budget: int) -> dict:
+    """
+    Averages random .npy field out of core with given budget and in memory,
+    returns max deviation between them, time and peak resident memory growth
+    of out of core run, None where profiling.peak_rss cant measure it. Resident
+    memory is measured for the whole process, so run it before anything else
+    allocates big arrays.
+    """
+    averager.basic_array_averaging(np.zeros(tuple(4 for _ in shape)), radius, method='separable')
+    with tempfile.TemporaryDirectory() as directory:
+        in_path, out_path = os.path.join(directory, "in.npy"), os.path.join(directory, "out.npy")
+        field = np.lib.format.open_memmap(in_path, mode='w+', dtype=np.float64, shape=shape)
+        for start in range(0, shape[0], 16):
+            layers = field[start:start + 16]
+            layers[...] = np.random.default_rng(start).random(layers.shape)
+        field.flush()
+        del field
+
+        before = profiling.peak_rss()
+        start = time.perf_counter()
+        result = averager.out_of_core_averaging(in_path, out_path, radius,
+                                                iterations_number=iterations,
+                                                memory_budget=memory_budget)
+        elapsed = time.perf_counter() - start
+        after = profiling.peak_rss()
+        peak = None if before is None else (after - before) * 1024
+
+        reference = averager.iterate_averaging(
+            np.load(in_path), iterations,
+            lambda source, out: averager.basic_array_averaging(source, radius, method='separable',
+                                                               out=out))
+        deviation = float(np.max(np.abs(np.asarray(result) - reference)))
+        del result
+    return {"deviation": deviation, "time": elapsed, "peak_growth": peak}
+
+
+def compare_ingest(rows: int, columns: int, workers: list) -> list:
+    """
+    Parses random csv of given size serially and with every number of workers,
+    checks parallel columns are equal to serial ones and returns MB/s of each run
+    """
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.random((rows, columns)), columns=[f"c{i}" for i in range(columns)])
+    frame.insert(0, "index", np.arange(rows))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ingest.csv")
+        frame.to_csv(path, index=False)
+        names = list(frame.columns)
+        reference = None
+        for count in [1] + [count for count in workers if count != 1]:
+            stats = {}
+            parsed = structures.read_csv_columns(path, names, count, stats)
+            if reference is None:
+                reference = parsed
+            assert all(np.array_equal(parsed[name], reference[name]) for name in names)
+            results.append(stats)
+    return results
+
+
+def check_zero_copy() -> dict:
+    """
+    Asserts that advance_to_column returns a view of float column buffer and that
+    update_dataset_column writes results back into the same buffer, for both
+    float dtypes. Returns what was checked.
+    """
+    checked = {}
+    for dtype in averager.FIELD_DTYPES:
+        frame = pd.DataFrame({"x": np.arange(60.0), "u": np.random.default_rng(0).random(60)})
+        data = structures.StreamData(frame, 5, 4, 3, dtype=dtype)
+        buffer = data.column("u")
+
+        field = structures.advance_to_column(data, "u")
+        assert field.shape == (3, 4, 5) and np.shares_memory(field, buffer)
+
+        result = averager.basic_array_averaging(field, 1, method='separable')
+        structures.update_dataset_column(data, "u", result)
+        assert np.shares_memory(data.column("u"), buffer)
+        assert np.array_equal(data.column("u"), result.reshape(-1))
+        checked[dtype.name] = "view and in-place update"
+    return checked
+
+
+class _CollectingSink:
+    def __init__(self):
+        self.states = []
+
+    def report(self, progress, state):
+        self.states.append(state)
+
+
+def compare_progress(shape: tuple, radius: int, processes: int, repeats: int) -> dict:
+    """
+    Times direct parallel averaging with and without progress reports, asserts
+    both give the same field and that reports of done rows only grow and end at
+    all rows. Returns both times, overhead fraction and number of reports.
+    """
+    field = np.random.default_rng(0).random(shape)
+    sink = _CollectingSink()
+    averager.set_progress_sinks([sink])
+    try:
+        with averager.AveragingExecutor(processes) as executor:
+            def average(visuals):
+                return averager.basic_array_averaging(field, radius, 'direct', processes,
+                                                      visuals, executor)
+
+            assert np.array_equal(average(False), average(True))
+            done = [state["done"] for state in sink.states]
+            assert done == sorted(done) and done[-1] == shape[0]
+            reports = len(sink.states)
+
+            silent = time_call(average, False, repeats=repeats)
+            reported = time_call(average, True, repeats=repeats)
+    finally:
+        averager.set_progress_sinks(None)
+    return {"silent": silent, "reported": reported, "overhead": reported / silent - 1,
+            "reports": reports}
+
+
+STARTUP_JOB = """
+import numpy as np
+import averager
+field = np.random.default_rng(0).random((24, 24, 24))
+averager.basic_3d_averaging_iterations(field, 2, 1)
+averager.gauss_3d_averaging_iterations(field, 2, 1)
+averager.basic_3d_averaging_iterations(field, 1, 1, 2, method='direct')
+"""
+
+
+# modules main.py must not import for --help, and for averaging-only jobs (first two)
+LAZY_MODULES = ["matplotlib", "useful_graphics", "numba", "pandas", "averager", "structures",
+                "numpy", "tqdm"]
+
+
+def _import_times(args: list, cwd: str) -> dict:
+    """Cumulative import time in microseconds of every top-level import of python run"""
+    run = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=cwd,
+                         capture_output=True, text=True, check=True)
+    times = {}
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented under the one that caused them
+        if not name[1:].startswith(" "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def check_import_time(budget: float) -> dict:
+    """
+    Asserts main.py --help imports none of LAZY_MODULES and its imports take at most
+    budget seconds, and that plot-free averaging job imports no plotting modules.
+    Returns import seconds of --help and modules the job imported.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    times = _import_times([os.path.join(root, "main.py"), "--help"], root)
+    heavy = [name for name in times if name.split(".")[0] in LAZY_MODULES]
+    assert not heavy, "main.py --help imports " + ", ".join(heavy)
+    total = sum(times.values()) / 1e6
+    assert total <= budget, f"main.py --help imports take {total:.3f}s, budget {budget:.3f}s"
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "field.csv")
+        pd.DataFrame({"u": np.random.default_rng(0).random(64)}).to_csv(path, index=False)
+        job = _import_times([os.path.join(root, "main.py"), path, "-d", "8,8", "-j", "basic_2d",
+                             "-c", "u", "--no-cache"], root)
+    plotting = [name for name in job if name.split(".")[0] in LAZY_MODULES[:2]]
+    assert not plotting, "basic_2d job imports " + ", ".join(plotting)
+    return {"help": total, "job": sorted(name for name in job
+                                         if name.split(".")[0] in LAZY_MODULES)}
+
+
+def compare_startup(repeats: int = 1) -> dict:
+    """
+    Times short averaging job in fresh interpreter, like the ones GUI launches:
+    with empty numba cache, where every kernel compiles, and with cache filled
+    by averager.precompile. Caches live in temporary NUMBA_CACHE_DIR, so cache
+    next to averager is left alone. Returns seconds of every run.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    def run(code: str, cache: str) -> float:
+        environment = dict(os.environ, NUMBA_CACHE_DIR=cache,
+                           PYTHONPATH=os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=environment, check=True, cwd=root)
+        return time.perf_counter() - start
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cold, tempfile.TemporaryDirectory() as warm:
+        results["cold"] = run(STARTUP_JOB, cold)
+        results["precompile"] = run("import averager; averager.precompile()", warm)
+        results["warm"] = min(run(STARTUP_JOB, warm) for _ in range(repeats))
+        results["import"] = min(run("import averager", warm) for _ in range(repeats))
+    return results
+
+
+def _cuda_case(func):
+    """Suite case of gpu engine, timed with copies to and from device"""
+    from numba import cuda
+
+    def call(field, extent, iterations, executor):
+        return func(cuda.to_device(field), extent).copy_to_host()
+    return call
+
+
+def suite_cases() -> dict:
+    """
+    Engines timed by run_suite: name to (field dimensions or None for both,
+    whether workers matter, whether it loops in python, whether it iterates,
+    call(field, extent, iterations, executor))
+    """
+    cases = {
+        "basic_2d_array_averaging": (2, False, True, False,
+                                     lambda field, r, n, executor:
+                                     averager.basic_2d_array_averaging(field, r)),
+        "basic_3d_array_averaging": (3, False, True, False,
+                                     lambda field, r, n, executor:
+                                     averager.basic_3d_array_averaging(field, r)),
+        "basic_2d_array_averaging_parallel": (
+            2, True, False, False, lambda field, r, n, executor:
+            averager.basic_2d_array_averaging_parallel(field, r, executor.processes,
+                                                       executor=executor)),
+        "basic_3d_array_averaging_parallel": (
+            3, True, False, False, lambda field, r, n, executor:
+            averager.basic_3d_array_averaging_parallel(field, r, executor.processes,
+                                                       executor=executor)),
+        "average_2d_by_gauss": (2, False, True, False,
+                                lambda field, r, n, executor:
+                                averager.average_2d_by_gauss(field, r)),
+        "average_3d_by_gauss": (3, False, True, False,
+                                lambda field, r, n, executor:
+                                averager.average_3d_by_gauss(field, r)),
+    }
+    for method in ["separable", "sat", "fft"]:
+        cases["basic_" + method] = (
+            None, method == "separable", False, False,
+            lambda field, r, n, executor, method=method:
+            averager.basic_array_averaging(field, r, method, executor.processes,
+                                           executor=executor))
+    for method in ["parallel", "fft", "recursive"]:
+        cases["gauss_" + method] = (
+            None, method != "fft", False, False,
+            lambda field, r, n, executor, method=method:
+            averager.gauss_array_averaging(field, r, method, executor=executor,
+                                           threads=executor.processes))
+    for name in ["basic_2d_averaging_iterations", "basic_3d_averaging_iterations",
+                 "gauss_2d_averaging_iterations", "gauss_3d_averaging_iterations"]:
+        cases[name] = (
+            int(name.split("_")[1][0]), True, False, True,
+            lambda field, r, n, executor, func=getattr(averager, name):
+            func(field, n, r, executor.processes, executor=executor))
+
+    try:
+        from numba import cuda
+        available = cuda.is_available()
+    except ImportError:
+        available = False
+    if available:
+        import averager_cuda
+        cases["cuda_basic_2d_array_averaging"] = (
+            2, False, False, False, _cuda_case(averager_cuda.cuda_basic_2d_array_averaging))
+        cases["cuda_basic_3d_array_averaging"] = (
+            3, False, False, False, _cuda_case(averager_cuda.cuda_basic_3d_array_averaging))
+    return cases
+
+
+def run_suite(shapes: list, extents: list, iterations: list, workers: list,
+              repeats: int = 3, names: list = None) -> dict:
+    """
+    Times every suite case over matrix of field shapes, radii (sigmas for gauss),
+    iteration counts of iteration drivers and worker counts of parallel engines.
+    First call of every configuration is recorded apart as "warmup": it includes
+    JIT compilation the first time a case runs and first touch of buffers.
+    Steady state is "best" and "median" of repeats calls after it.
+
+    Args:
+        shapes (list): field shapes, 2d ones go to 2d engines, 3d ones to 3d engines
+        extents (list): radii of basic averaging and sigmas of gauss averaging
+        iterations (list): iteration counts of iteration drivers, others run once
+        workers (list): processes or threads of engines that use them, others run with 1
+        repeats (int, optional): steady state calls. Defaults to 3.
+        names (list, optional): cases to run, all of suite_cases if None
+
+    Returns:
+        dict: "meta" with versions and machine, "results" with record of every run
+    """
+    cases = suite_cases()
+    results = []
+    for count in sorted(set(workers)):
+        with averager.AveragingExecutor(count) as executor:
+            for name in names or cases:
+                dims, parallel, python, iterating, call = cases[name]
+                if not parallel and count != min(workers):
+                    continue
+                for shape in shapes:
+                    if dims not in (None, len(shape)) or \
+                            python and int(np.prod(shape)) > SUITE_PYTHON_LIMIT:
+                        continue
+                    field = np.random.default_rng(0).random(shape)
+                    for extent in extents:
+                        for count_iterations in iterations if iterating else [1]:
+                            start = time.perf_counter()
+                            call(field, extent, count_iterations, executor)
+                            warmup = time.perf_counter() - start
+
+                            times = []
+                            for _ in range(repeats):
+                                start = time.perf_counter()
+                                call(field, extent, count_iterations, executor)
+                                times.append(time.perf_counter() - start)
+                            results.append({
+                                "case": name, "shape": list(shape), "extent": extent,
+                                "iterations": count_iterations, "workers": count if parallel else 1,
+                                "warmup": warmup, "times": times, "best": min(times),
+                                "median": float(np.median(times))})
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__,
+            "numba": sys.modules["numba"].__version__, "machine": platform.machine(),
+            "cpus": os.cpu_count(), "repeats": repeats,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"meta": meta, "results": results}
+
+
+def _suite_key(record: dict) -> tuple:
+    return (record["case"], tuple(record["shape"]), record["extent"], record["iterations"],
+            record["workers"])
+
+
+def compare_suites(old: dict, new: dict, threshold: float = 0.1) -> list:
+    """
+    Matches records of two run_suite results by configuration and returns
+    relative change of steady state median for each of them, positive is slower.
+    Records missing from one of results are left out.
+
+    Args:
+        old (dict): baseline results
+        new (dict): results to check
+        threshold (float, optional): relative slowdown flagged as regression. Defaults to 0.1.
+
+    Returns:
+        list: dicts with "key", "old", "new" medians, "change" and "regression" flag
+    """
+    baseline = {_suite_key(record): record for record in old["results"]}
+    changes = []
+    for record in new["results"]:
+        before = baseline.get(_suite_key(record))
+        if before is None:
+            continue
+        change = record["median"] / before["median"] - 1
+        changes.append({"key": _suite_key(record), "old": before["median"],
+                        "new": record["median"], "change": change,
+                        "regression": change > threshold})
+    return changes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shape', '-s', help='field shape seperated by comma',
+                        type=str, default='32,32,32')
+    parser.add_argument('--sigma', help='gauss sigma', type=int, default=2)
+    parser.add_argument('--radius', '-r', help='box averaging radius', type=int, default=2)
+    parser.add_argument('--repeats', help='number of timed runs', type=int, default=1)
+    parser.add_argument('--gauss', help='time python and compiled gauss on --shape field, '
+                        'done when no other check is asked for too', action='store_true')
+    parser.add_argument('--precision', help='compare float32 results with float64 ones',
+                        action='store_true')
+    parser.add_argument('--recursive', help='compare recursive gauss with windowed one',
+                        action='store_true')
+    parser.add_argument('--out-of-core', help='average out of core with budget in MB',
+                        type=int)
+    parser.add_argument('--iterations', '-i', help='number of iterations', type=int, default=1)
+    parser.add_argument('--zero-copy', help='check column access between StreamData and '
+                        'averagers makes no copies', action='store_true')
+    parser.add_argument('--progress', help='time direct averaging of --shape field with and '
+                        'without progress reports, using --workers processes', action='store_true')
+    parser.add_argument('--ingest', help='parse csv of that many rows with --ingest-columns '
+                        'columns serially and in parallel', type=int)
+    parser.add_argument('--ingest-columns', help='float columns of --ingest csv', type=int,
+                        default=8)
+    parser.add_argument('--workers', help='numbers of worker processes seperated by comma, '
+                        'for --ingest and --suite', type=str, default='1,4')
+    parser.add_argument('--csv-chunk', help='bytes parsed by one csv task, to split small files',
+                        type=int)
+    parser.add_argument('--suite', help='time every engine over matrix of --sizes, --extents, '
+                        '--suite-iterations and --workers', action='store_true')
+    parser.add_argument('--sizes', help='field shapes of suite seperated by comma, '
+                        'sizes joined by x', type=str, default='256x256,48x48x48')
+    parser.add_argument('--extents', help='radii and sigmas of suite seperated by comma',
+                        type=str, default='1,3')
+    parser.add_argument('--suite-iterations', help='iteration counts of suite seperated by comma',
+                        type=str, default='1,5')
+    parser.add_argument('--cases', help='suite cases seperated by comma, all by default', type=str)
+    parser.add_argument('--json', help='write suite results to that file', type=str)
+    parser.add_argument('--compare', help='compare two suite result files, baseline first',
+                        nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', help='relative slowdown of median flagged by --compare',
+                        type=float, default=0.1)
+    parser.add_argument('--startup', help='time short job in fresh interpreter with cold '
+                        'and warm numba cache', action='store_true')
+    parser.add_argument('--import-time', help='check main.py --help imports fit budget in ms '
+                        'and jobs import only modules they need', type=float)
+    args = parser.parse_args()
+
+    if args.import_time:
+        result = check_import_time(args.import_time / 1000)
+        print(f"main.py --help imports: {result['help'] * 1000:.1f}ms, "
+              f"basic_2d job imports " + ", ".join(result["job"]))
+
+    if args.startup:
+        result = compare_startup(args.repeats)
+        print(f"startup job: cold cache {result['cold']:.2f}s, "
+              f"precompile {result['precompile']:.2f}s, warm cache {result['warm']:.2f}s, "
+              f"import only {result['import']:.2f}s")
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            old = json.load(file)
+        with open(args.compare[1]) as file:
+            new = json.load(file)
+        changes = compare_suites(old, new, args.threshold)
+        for change in changes:
+            name, shape, extent, iterations, workers = change["key"]
+            print(f"{'REGRESSION' if change['regression'] else 'ok':>10} {name} "
+                  f"{'x'.join(map(str, shape))} r={extent} n={iterations} w={workers}: "
+                  f"{change['old']:.4f}s -> {change['new']:.4f}s ({change['change']:+.1%})")
+        sys.exit(1 if any(change["regression"] for change in changes) else 0)
+
+    if args.suite:
+        suite = run_suite([tuple(int(size) for size in shape.split('x'))
+                           for shape in args.sizes.split(',')],
+                          [int(extent) for extent in args.extents.split(',')],
+                          [int(count) for count in args.suite_iterations.split(',')],
+                          [int(count) for count in args.workers.split(',')],
+                          args.repeats, args.cases.split(',') if args.cases else None)
+        for record in suite["results"]:
+            print(f"{record['case']} {'x'.join(map(str, record['shape']))} "
+                  f"r={record['extent']} n={record['iterations']} w={record['workers']}: "
+                  f"warmup {record['warmup']:.4f}s, best {record['best']:.4f}s, "
+                  f"median {record['median']:.4f}s")
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(suite, file, indent=1)
+        sys.exit(0)
+
+    if args.ingest:
+        if args.csv_chunk:
+            structures.CSV_CHUNK = args.csv_chunk
+        workers = [int(count) for count in args.workers.split(',')]
+        for stats in compare_ingest(args.ingest, args.ingest_columns, workers):
+            print(f"csv {stats['bytes'] / 2 ** 20:.1f}MB with {stats['workers']} workers: "
+                  f"{stats['seconds']:.3f}s, {stats['mb_per_s']:.1f} MB/s")
+
+    if args.zero_copy:
+        for name, result in check_zero_copy().items():
+            print(f"{name} columns: {result} share memory")
+
+    if args.progress:
+        shape = tuple(int(size) for size in args.shape.split(','))
+        processes = int(args.workers.split(',')[-1])
+        result = compare_progress(shape, 1, processes, args.repeats)
+        print(f"direct {shape} with {processes} processes: {result['silent']:.3f}s silent, "
+              f"{result['reported']:.3f}s with {result['reports']} progress reports, "
+              f"overhead {result['overhead']:+.1%}")
+
+    if args.out_of_core:
+        shape = tuple(int(size) for size in args.shape.split(','))
+        result = compare_out_of_core(shape, args.radius, args.iterations,
+                                     args.out_of_core * 2 ** 20)
+        growth = "unknown" if result["peak_growth"] is None \
+            else f"{result['peak_growth'] / 2 ** 20:.1f}MB"
+        print(f"out of core {shape} budget {args.out_of_core}MB: {result['time']:.3f}s, "
+              f"peak resident growth {growth}, "
+              f"max deviation from in memory {result['deviation']:.2e}")
+
+    if args.recursive:
+        shape = tuple(int(size) for size in args.shape.split(','))
+        for shape in [shape, RECURSIVE_GAUSS_SMALL[:len(shape)]]:
+            for result in compare_recursive_gauss(shape, [1, 2, 5, 10, 30], args.repeats):
+                print(f"recursive gauss {shape} sigma={result['sigma']}: "
+                      f"max deviation random {result['random']:.2e}, "
+                      f"smooth {result['smooth']:.2e}; windowed {result['parallel']:.3f}s, "
+                      f"recursive {result['recursive']:.3f}s")
+
+    if args.precision:
+        shape = tuple(int(size) for size in args.shape.split(','))
+        deviations = compare_precision(shape, args.radius, args.sigma, args.iterations)
+        for name, deviation in deviations.items():
+            print(f"{name}: max relative float32 deviation {deviation:.2e}")
+
+    checks = [args.import_time, args.startup, args.ingest, args.zero_copy, args.progress,
+              args.out_of_core, args.recursive, args.precision]
+    if args.gauss or not any(checks):
+        result = compare_gauss(tuple(int(size) for size in args.shape.split(',')),
+                               args.sigma, args.repeats)
+        print(f"gauss {result['shape']} sigma={result['sigma']}: "
+              f"python {result['python']:.3f}s, parallel {result['parallel']:.3f}s, "
+              f"speedup x{result['speedup']:.1f}")
@@ -1,13 +1,20 @@
 import argparse
-import structures
+import functools
 import logging
-import averager
-import useful_graphics
+import sys
+from typing import TYPE_CHECKING
 
-import numpy as np
+import profiling
+
+if TYPE_CHECKING:
+    import averager
+    import structures
+
+# averager (numba), structures (pandas) and useful_graphics (matplotlib) are imported
+# only by jobs that use them, so --help and plot-free jobs start without them
 
 parser = argparse.ArgumentParser()
-parser.add_argument('inputfile', help='input csv file', type=str)
+parser.add_argument('inputfile', help='input csv file', type=str, nargs='?')
 
 # TODO: add x, y, z args
 
@@ -19,11 +26,19 @@ parser.add_argument('--vv', help='verbose MORE progress', action='store_true')
 
 parser.add_argument('--leave', help='tkinter-output mode', action='store_true')
 
+parser.add_argument('--progress', help='how -v and --vv progress is shown: tqdm bars or json '
+                    'lines for other programs {tqdm, json}', type=str, choices=['tqdm', 'json'],
+                    default='tqdm')
+parser.add_argument('--progress-fd', help='file descriptor to write json progress lines to, '
+                    'stdout by default, then the rest of output goes to stderr', type=int)
+
 parser.add_argument('--dimensions', '-d', help='dimensions seperated by comma', type=str)
 
 parser.add_argument('--job', '-j',
                     help='job to do with opened Data {' + 'basic2d' +
-                    "'basic2d_paral', 'basic3d', 'basic3d_paral', 'gauss', 'plot2d', 'scatter3d'}",
+                    "'basic2d_paral', 'basic3d', 'basic3d_paral', 'basic_2d_direct', " +
+                    "'basic_3d_direct', 'basic_2d_sat', 'basic_3d_sat', 'gauss', " +
+                    "'gauss_recursive', 'plot2d', 'scatter3d'}",
                     type=str)
 
 parser.add_argument('--columns', '-c', help='columns to do jobs seperated by comma', type=str)
@@ -31,69 +46,184 @@ parser.add_argument('--columns', '-c', help='columns to do jobs seperated by com
 parser.add_argument('--radius', '-r', help='averaging radius', type=int)
 parser.add_argument('--iterations', '-i', help='number of iterations', type=int)
 
+parser.add_argument('--tol', help='stop iterating once field changes less than tol, '
+                    'iterations then is the upper limit', type=float)
+parser.add_argument('--norm', help='measure of change for --tol {max, rms}', type=str,
+                    choices=['max', 'rms'], default='max')
+
 parser.add_argument('--outfile', '-o', help='output file', type=str)
 
-args = parser.parse_args()
+parser.add_argument('--precision', help='significant digits of saved floats, exact by default',
+                    type=int)
+
+parser.add_argument('--dtype', help='float precision of fields {float64, float32}',
+                    type=str, choices=['float64', 'float32'], default='float64')
+
+parser.add_argument('--no-cache', help='parse input without binary column cache',
+                    action='store_true')
+parser.add_argument('--rebuild-cache', help='parse input and rewrite its binary column cache',
+                    action='store_true')
+
+parser.add_argument('--read-workers', help='processes parsing input csv, all CPUs by default',
+                    type=int)
+
+parser.add_argument('--profile', help='write Chrome trace json of stages to that file '
+                    'and print their summary', type=str, metavar='TRACE')
+
+parser.add_argument('--warmup', help='compile averaging kernels into on-disk cache, '
+                    'so later runs start without compiling', action='store_true')
+
+parser.add_argument('--cost-model', type=str,
+                    help='json with engine costs made by averager.calibrate_cost_model')
+
+args = None
 
 DEFAULT_HEADER = 2
 DEFAULT_VERBOSE = False
 DEFAULT_MORE_VERBOSE = False
 DEFAULT_LEAVE = True
 DEFAULT_RADIUS = 1
+PARALLEL_PROCESSES = 4  # processes or threads of _paral jobs
 DEFAULT_ITERATIONS = 1
+DEFAULT_TOL = None
 DIM_X, DIM_Y, DIM_Z = 0, 0, 0
 
 LOG_FORMAT = '\n> %(asctime)s %(message)s\n'
 logging.basicConfig(format=LOG_FORMAT)
 logger = logging.getLogger()
 
+# averager function and its keyword arguments of every job, resolved when job runs
 job_types = {
-    "basic_2d": averager.basic_2d_averaging_iterations,
-    "basic_2d_paral": averager.basic_2d_averaging_iterations,
-    "basic_3d":  averager.basic_3d_averaging_iterations,
-    "basic_3d_paral": averager.basic_3d_averaging_iterations
+    "basic_2d": ("basic_2d_averaging_iterations", {}),
+    "basic_2d_paral": ("basic_2d_averaging_iterations", {}),
+    "basic_3d": ("basic_3d_averaging_iterations", {}),
+    "basic_3d_paral": ("basic_3d_averaging_iterations", {}),
+    "basic_2d_direct": ("basic_2d_averaging_iterations", {"method": 'direct'}),
+    "basic_3d_direct": ("basic_3d_averaging_iterations", {"method": 'direct'}),
+    "basic_2d_sat": ("basic_2d_averaging_iterations", {"method": 'sat'}),
+    "basic_3d_sat": ("basic_3d_averaging_iterations", {"method": 'sat'}),
+    "gauss": ("gauss_3d_averaging_iterations", {}),
+    "gauss_recursive": ("gauss_3d_averaging_iterations", {"method": 'recursive'})
+}
+
+# same jobs run on all columns stacked together, used when job has several columns
+batch_job_types = {
+    "basic_2d": ("basic_batch_averaging_iterations", {}),
+    "basic_2d_paral": ("basic_batch_averaging_iterations", {}),
+    "basic_3d": ("basic_batch_averaging_iterations", {}),
+    "basic_3d_paral": ("basic_batch_averaging_iterations", {}),
+    "basic_2d_direct": ("basic_batch_averaging_iterations", {"method": 'direct'}),
+    "basic_3d_direct": ("basic_batch_averaging_iterations", {"method": 'direct'}),
+    "basic_2d_sat": ("basic_batch_averaging_iterations", {"method": 'sat'}),
+    "basic_3d_sat": ("basic_batch_averaging_iterations", {"method": 'sat'}),
+    "gauss": ("gauss_batch_averaging_iterations", {}),
+    "gauss_recursive": ("gauss_batch_averaging_iterations", {"method": 'recursive'})
 }
 
-graphics_types = ['plot2d', 'scatter_3d']
+graphics_types = ['plot2d', 'scatter3d']
+
+
+def job_function(table, job):
+    """Averager function of job from job_types or batch_job_types, None if table has no job"""
+    if job not in table:
+        return None
+    import averager
+    name, kwargs = table[job]
+    return functools.partial(getattr(averager, name), **kwargs)
+
+
+def job_processes(job):
+    """Processes or threads job is run with and its executor is sized for. Jobs other
+    than _paral ones get 1, so box engines run serially and gauss ones keep default
+    numba threads"""
+    return PARALLEL_PROCESSES if job.find("paral") != -1 else 1
+
+
+def report_convergence(history, iters, target):
+    if len(history) < iters or history[-1] < DEFAULT_TOL:
+        logger.warning(f"{target} converged after {len(history)} iterations, "
+                       f"{args.norm} residual {history[-1]:.3e}")
+    else:
+        logger.warning(f"{target} did not converge in {iters} iterations, "
+                       f"{args.norm} residual {history[-1]:.3e}")
+    logger.warning("Residual history: " + ", ".join(f"{change:.3e}" for change in history))
+
 
+def perform(func, data: "structures.StreamData", columns, iters, radius,
+            verbose=False, _job="", executor: "averager.AveragingExecutor" = None,
+            batch_func=None):
+    import numpy as np
+    import structures
 
-def perform(func, data: structures.StreamData, columns, iters, radius,
-            verbose=False, _job=""):
     rs = []
     proc = 0
+    history = []
+    convergence = {"tol": DEFAULT_TOL, "norm": args.norm, "history": history}
 
-    if _job.find("paral") != -1:
-        proc = 4
+    proc = job_processes(_job)
 
-    else:
-        proc = 1
+    if batch_func is not None and len(columns) > 1:
+        print()
+        logger.warning(f"Performing Job {_job} on " + ", ".join(columns))
+        fields = []
+        for col in columns:
+            with profiling.span("advance_to_column", column=col):
+                fields.append(structures.advance_to_column(data, col))
+        with profiling.span("stack"):
+            fields = np.stack(fields)
+        with profiling.span("average", job=_job, column=",".join(columns)):
+            result = batch_func(fields, iters, radius, proc, verbose, DEFAULT_MORE_VERBOSE,
+                                DEFAULT_LEAVE, executor=executor, **convergence)
+        if DEFAULT_TOL is not None:
+            report_convergence(history, iters, ", ".join(columns))
+        return [{"result": result[channel], "column": col}
+                for channel, col in enumerate(columns)]
 
     for col in columns:
         print()
         logger.warning(f"Performing Job {_job} on " + col)
-        rs.append({"result": func(
-            np.asarray(structures.advance_to_column(data, col)), iters, radius, proc, verbose,
-            DEFAULT_MORE_VERBOSE, DEFAULT_LEAVE), "column": col})
+        history.clear()
+        with profiling.span("advance_to_column", column=col):
+            field = np.asarray(structures.advance_to_column(data, col))
+        with profiling.span("average", job=_job, column=col):
+            rs.append({"result": func(field, iters, radius, proc, verbose, DEFAULT_MORE_VERBOSE,
+                                      DEFAULT_LEAVE, executor=executor, **convergence),
+                       "column": col})
+        if DEFAULT_TOL is not None:
+            report_convergence(history, iters, col)
 
     return rs
 
 
-def do_job(jobs, data: structures.StreamData, columns, iters, radius, verbose=False):
+def do_job(jobs, data: "structures.StreamData", columns, iters, radius, verbose=False):
+    import structures
+
     results = {
         "jobs_avgs": [],
         "jobs_grpx": []
     }
 
-    for job in jobs:
-        if job in graphics_types:
-            continue
+    averaging_jobs = [job for job in jobs if job not in graphics_types]
+    if averaging_jobs:
+        import averager
 
-        results['jobs_avgs'].append(perform(job_types[job], data,
-                                            columns, iters, radius, verbose, job))
+        # one executor per run, so workers start and compile kernels only once. It is
+        # sized for the job asking for most workers, others use part of it
+        processes = max(job_processes(job) for job in averaging_jobs)
+        with averager.AveragingExecutor(processes=processes) as executor:
+            for job in averaging_jobs:
+                results['jobs_avgs'].append(perform(job_function(job_types, job), data,
+                                                    columns, iters, radius, verbose, job,
+                                                    executor,
+                                                    job_function(batch_job_types, job)))
 
     if len(results['jobs_avgs']) > 0:
         for elem in results['jobs_avgs'][0]:
-            structures.update_dataset_column(data, elem["column"], elem["result"])
+            with profiling.span("update_dataset_column", column=elem["column"]):
+                structures.update_dataset_column(data, elem["column"], elem["result"])
+
+    if 'plot2d' in jobs or 'scatter3d' in jobs:
+        import useful_graphics
 
     if 'plot2d' in jobs:
         for col in columns:
@@ -112,56 +242,103 @@ def do_job(jobs, data: structures.StreamData, columns, iters, radius, verbose=Fa
     return results
 
 
-if args.lines:
-    DEFAULT_HEADER = args.Header
+def main(argv=None):
+    global args, DEFAULT_HEADER, DEFAULT_VERBOSE, DEFAULT_MORE_VERBOSE, DEFAULT_LEAVE
+    global DEFAULT_RADIUS, DEFAULT_ITERATIONS, DEFAULT_TOL, DIM_X, DIM_Y, DIM_Z
 
-if args.verbose:
-    DEFAULT_VERBOSE = True
+    args = parser.parse_args(argv)
+    if args.inputfile is None and not args.warmup:
+        parser.error('the following arguments are required: inputfile')
 
-if args.vv:
-    DEFAULT_MORE_VERBOSE = True
+    if args.lines:
+        DEFAULT_HEADER = args.Header
 
-if args.dimensions:
-    dims = str(args.dimensions).split(',')
-    if len(dims) not in [2, 3]:
-        logger.error("Incorrect number of dimensions!")
-        exit()
+    if args.verbose:
+        DEFAULT_VERBOSE = True
 
-    else:
-        DIM_X, DIM_Y = int(dims[0]), int(dims[1])
+    if args.vv:
+        DEFAULT_MORE_VERBOSE = True
 
-        if len(dims) == 3:
-            DIM_Z = int(dims[2])
+    if args.dimensions:
+        dims = str(args.dimensions).split(',')
+        if len(dims) not in [2, 3]:
+            logger.error("Incorrect number of dimensions!")
+            exit()
 
-if args.radius:
-    DEFAULT_RADIUS = args.radius
+        else:
+            DIM_X, DIM_Y = int(dims[0]), int(dims[1])
 
-if args.iterations:
-    DEFAULT_ITERATIONS = args.iterations
+            if len(dims) == 3:
+                DIM_Z = int(dims[2])
 
-if args.leave:
-    DEFAULT_LEAVE = False
+    if args.radius:
+        DEFAULT_RADIUS = args.radius
+
+    if args.iterations:
+        DEFAULT_ITERATIONS = args.iterations
+
+    if args.leave:
+        DEFAULT_LEAVE = False
+
+    if args.tol is not None:
+        DEFAULT_TOL = args.tol
+
+    if args.cost_model:
+        import averager
+        averager.load_cost_model(args.cost_model)
+
+    if args.profile:
+        profiling.enable()
+
+    if args.progress == 'json':
+        import averager
+        stream = None
+        if args.progress_fd is None:
+            # stdout is left to json lines, logo and printed results go to stderr
+            stream = sys.stdout
+            sys.stdout = sys.stderr
+        averager.set_progress_sinks([averager.JsonLinesProgressSink(stream,
+                                                                    fd=args.progress_fd)])
 
-if __name__ == '__main__':
     with open('.logo.txt') as file:
         print(file.read())
 
     logger.warning('Averager Init Done!')
 
-    data = structures.StreamData(args.inputfile, DIM_X, DIM_Y, DIM_Z)
+    if args.warmup:
+        import averager
+        with profiling.span("warmup"):
+            averager.precompile()
+        logger.warning('Kernels compiled and cached!')
+        if args.inputfile is None:
+            exit(0)
+
+    import structures
+
+    with profiling.span("open"):
+        data = structures.StreamData(args.inputfile, DIM_X, DIM_Y, DIM_Z, dtype=args.dtype,
+                                     cache=not args.no_cache, rebuild_cache=args.rebuild_cache,
+                                     workers=args.read_workers)
     logger.warning('File Loading Done!')
 
     if DEFAULT_VERBOSE:
-        print(data.dataset)
+        print(data.to_pandas())
 
     if args.job:
         columns = str(args.columns).split(",")
         jobs = str(args.job).split(",")
 
         for col in columns:  # first check if column exists
-            if col not in data.dataset:
+            if col not in data.schema:
                 logger.error("Wrong Column: " + col)
                 exit(1)
+        # only job columns are parsed now, the rest when output needs them
+        with profiling.span("load", column=",".join(columns)):
+            data.load(columns)
+        if data.ingest:
+            logger.warning(f"Parsed {data.ingest['bytes'] / 2 ** 20:.1f} MB in "
+                           f"{data.ingest['seconds']:.2f}s, {data.ingest['mb_per_s']:.1f} MB/s "
+                           f"with {data.ingest['workers']} workers")
 
         logger.warning("Started Job: " + args.job)
         results = do_job(jobs, data, columns, DEFAULT_ITERATIONS, DEFAULT_RADIUS, DEFAULT_VERBOSE)
@@ -174,13 +351,24 @@ if __name__ == '__main__':
                 exit(0)
 
             try:
-                structures.save_temp_streamdata(data, args.outfile)
+                with profiling.span("save"):
+                    structures.save_temp_streamdata(data, args.outfile, args.precision)
                 logger.warning("Saving to " + args.outfile + ".out.csv done!")
 
             except Exception as ex:
                 print(ex)
                 logger.error("Error saving with your filename! Saving as out.csv")
-                structures.save_temp_streamdata(data, "out.csv")
+                structures.save_temp_streamdata(data, "out.csv", args.precision)
 
             print()
+
+    if args.profile:
+        profiler = profiling.disable()
+        profiler.write_trace(args.profile)
+        print(profiler.format_summary())
+        logger.warning("Trace written to " + args.profile)
     print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,173 @@
 import sys
 import os
-import subprocess
+import threading
 
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtGui import QIcon
 
 from ui import Ui_MainWindow
 
-import ctypes
-if sys.platform == 'win32':
-    CP_console = f"cp{ctypes.cdll.kernel32.GetConsoleOutputCP()}"
+PREVIEW_SHOWN_ROWS = 20  # first rows of opened file printed in output
+COORDINATES = ["x", "y", "z"]
 
-else:
-    CP_console = 'utf-8'
+# job checkbox to job of main.job_types and main.graphics_types
+JOB_BUTTONS = {
+    "basic2Button": "basic_2d",
+    "basic2pButton": "basic_2d_paral",
+    "basic3Button": "basic_3d",
+    "basic3pButton": "basic_3d_paral",
+    "basicGaussButton": "gauss",
+    "plot2dButton": "plot2d",
+    "plot3dButton": "scatter3d",
+}
+
+
+class ProgressSignalSink(QtCore.QObject):
+    """Progress sink of averager, passing reports to GUI thread as signal"""
+
+    reported = QtCore.pyqtSignal(dict)
+
+    def report(self, progress, state: dict):
+        self.reported.emit(state)
+
+
+class PreviewSignals(QtCore.QObject):
+    ready = QtCore.pyqtSignal(str, object)
+    failed = QtCore.pyqtSignal(str, str)
+
+
+class PreviewTask(QtCore.QRunnable):
+    """Reads structures.preview_csv of file on thread pool, so opening never waits
+    for parsing or for a running job"""
+
+    def __init__(self, path: str):
+        super(PreviewTask, self).__init__()
+        self.path = path
+        self.signals = PreviewSignals()
+
+    def run(self):
+        try:
+            import structures
+
+            self.signals.ready.emit(self.path, structures.preview_csv(self.path))
+        except Exception as ex:
+            self.signals.failed.emit(self.path, str(ex))
+
+
+class AveragingWorker(QtCore.QObject):
+    """
+    Runs averaging jobs on its own thread. Loaded StreamData, worker processes and
+    their compiled kernels stay between runs, so changing parameters doesn't parse
+    the file or start processes again. Averaged columns are kept apart from the
+    loaded ones, which stay as read from the file.
+    """
+
+    message = QtCore.pyqtSignal(str)
+    plotReady = QtCore.pyqtSignal(str, str, object)
+    finished = QtCore.pyqtSignal(bool)
+
+    def __init__(self):
+        super(AveragingWorker, self).__init__()
+        self.data = None
+        self.path = None
+        self.executor = None
+        self.cancel = threading.Event()
+        self.progress = ProgressSignalSink()
+
+    @QtCore.pyqtSlot()
+    def warm_up(self):
+        """Imports averaging modules and starts worker processes before the first run"""
+        import averager
+
+        averager.set_progress_sinks([self.progress])
+        averager.set_cancel_event(self.cancel)
+        self.executor = averager.AveragingExecutor(processes=os.cpu_count())
+        # pool starts on first use, its workers compile slab kernels right away
+        self.executor.pool
+
+    @QtCore.pyqtSlot(dict)
+    def run(self, task: dict):
+        """
+        Runs jobs of task, a dict with "path", "dimensions" (i, j, k), "jobs",
+        "columns", "radius", "iterations", "outfile" and "verbose"
+        """
+        import averager
+
+        self.cancel.clear()
+        try:
+            self._run(task)
+        except averager.AveragingCancelled:
+            self.message.emit("Cancelled!")
+            self.finished.emit(False)
+        except Exception as ex:
+            self.message.emit("Error: " + str(ex))
+            self.finished.emit(False)
+        else:
+            self.finished.emit(True)
+
+    def _run(self, task: dict):
+        import averager
+        import main
+        import structures
+
+        i, j, k = task["dimensions"]
+        if self.data is None or self.path != task["path"]:
+            self.data = structures.StreamData(task["path"], i, j, k)
+            self.path = task["path"]
+            self.message.emit("File Loading Done!")
+            if task["verbose"]:
+                self.message.emit(str(self.data.to_pandas()))
+        self.data.i, self.data.j, self.data.k = i, j, k
+
+        columns = task["columns"]
+        for col in columns:
+            if col not in self.data.schema:
+                raise KeyError("Wrong Column: " + col)
+        self.data.load(columns)
+
+        averaged = {}
+        for job in task["jobs"]:
+            func = main.job_function(main.job_types, job)
+            if func is None:
+                continue
+            processes = main.job_processes(job)
+            for col in columns:
+                if self.cancel.is_set():
+                    raise averager.AveragingCancelled(job)
+                self.message.emit(f"Performing Job {job} on {col}")
+                field = structures.advance_to_column(self.data, col)
+                result = func(field, task["iterations"], task["radius"], processes, True, True,
+                              executor=self.executor)
+                # like main.py, first averaging job is the one plotted and saved
+                averaged.setdefault(col, result)
+
+        for job in task["jobs"]:
+            if job in main.graphics_types:
+                for col in columns:
+                    field = averaged.get(col)
+                    if field is None:
+                        field = structures.advance_to_column(self.data, col)
+                    self.plotReady.emit(job, col, field)
+
+        if task["outfile"] and averaged:
+            # saved data shares loaded columns, only averaged ones are new
+            columns = self.data.arrays()
+            columns.update({col: result.reshape(-1) for col, result in averaged.items()})
+            result = structures.StreamData(columns, i, j, k, dtype=self.data.dtype)
+            structures.save_temp_streamdata(result, task["outfile"])
+            self.message.emit("Saving to " + task["outfile"] + ".out.csv done!")
+
+        self.message.emit("All jobs Done!")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.close()
+            self.executor = None
 
 
 class AveragerGUI(QtWidgets.QMainWindow):
+    runRequested = QtCore.pyqtSignal(dict)
+
     def __init__(self):
         super(AveragerGUI, self).__init__()
         self.ui = Ui_MainWindow()
@@ -23,39 +175,77 @@ class AveragerGUI(QtWidgets.QMainWindow):
         self.init_UI()
 
         self.ifile = ''
+        self.running = False
 
         self.ui.pushButton.clicked.connect(self.open_file)
         self.ui.RunButton.clicked.connect(self.callProgram)
 
-        self.process = QtCore.QProcess(self)
-        self.process.readyRead.connect(self.dataReady)
-
-        # self.process.started.connect(lambda: self.ui.RunButton.setEnabled(False))
-        self.process.finished.connect(lambda: print("FINISHED !!!"))
+        self.worker_thread = QtCore.QThread(self)
+        self.worker = AveragingWorker()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.warm_up)
+        self.runRequested.connect(self.worker.run)
+        self.worker.message.connect(self.ui.OutputBrowser.append)
+        self.worker.plotReady.connect(self.show_plot)
+        self.worker.progress.reported.connect(self.show_progress)
+        self.worker.finished.connect(self.run_finished)
+        self.worker_thread.start()
 
     def init_UI(self):
         self.setWindowTitle("Averager GUI - Lycoris Radiata")
         self.setWindowIcon(QIcon("icon.png"))
 
-    def dataReady(self):
-        cursor = self.ui.OutputBrowser.textCursor()
-        cursor.movePosition(cursor.End)
-
-        # Here we have to decode the QByteArray
-        cursor.insertText(
-            str(self.process.readAll(), CP_console))
-
-        cursor.insertText(
-            str(self.process.readAllStandardError().data().decode(CP_console).rstrip(' \n')) + '\n')
-
-        self.ui.OutputBrowser.ensureCursorVisible()
+        self.progressBar = QtWidgets.QProgressBar(self.ui.centralwidget)
+        self.progressBar.setVisible(False)
+        self.ui.OutputLayout.addWidget(self.progressBar)
+
+    def closeEvent(self, event):
+        # running job stops at the next part of its pass, so waiting for it is short
+        self.worker.cancel.set()
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.worker.close()
+        super(AveragerGUI, self).closeEvent(event)
+
+    def show_progress(self, state: dict):
+        self.progressBar.setVisible(state["status"] not in ("end", "cancelled"))
+        self.progressBar.setMaximum(state["total"])
+        self.progressBar.setValue(state["done"])
+        text = state["task"].lstrip("⚊ ") + ": %v/%m"
+        if "residual" in state["info"]:
+            text += f", residual {state['info']['residual']:.3e}"
+        self.progressBar.setFormat(text)
+
+    def show_plot(self, job: str, column: str, field):
+        import useful_graphics
+
+        # GUI event loop keeps running while plots are shown
+        useful_graphics.plt.ion()
+        if job == 'plot2d':
+            useful_graphics.plot_2d(field, title=column)
+        else:
+            useful_graphics.scatter_3d_array(field, title=column)
+        useful_graphics.plt.show()
+
+    def run_finished(self, done: bool):
+        self.running = False
+        self.progressBar.setVisible(False)
+        self.ui.RunButton.setText("Run")
 
     def callProgram(self):
-        # run the process
-        # `start` takes the exec and a list of arguments
-        command = self.make_run()
-        print('Running: ' + command)
-        self.process.start(command)
+        if self.running:
+            # engines check cancel event between parts of every pass, worker stops at once
+            self.worker.cancel.set()
+            self.ui.OutputBrowser.append("Cancelling...")
+            return
+
+        task = self.make_run()
+        if task is None:
+            return
+        self.running = True
+        self.ui.RunButton.setText("Cancel")
+        self.ui.OutputBrowser.append("Started Job: " + ",".join(task["jobs"]))
+        self.runRequested.emit(task)
 
     def open_file(self):
         fname = QtWidgets.QFileDialog.getOpenFileName(self, "Open CSV Data",
@@ -65,81 +255,74 @@ class AveragerGUI(QtWidgets.QMainWindow):
         if fname[0] != '':
             self.ui.pushButton.setText(fname[0].split('/')[-1])
             self.ifile = fname[0]
-            self.make_test_run()
-
-    def make_test_run(self):
-        command = "python main.py " + self.ifile + " -v --leave"
-        print("Executing: " + command)
-
-        # Create a subprocess and start the ping command
-        ping_process = subprocess.Popen(command, shell=True,
-                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.make_preview()
 
+    def make_preview(self):
         self.ui.OutputBrowser.clear()
-        for line in iter(ping_process.stdout.readline, b''):
-            line = line.decode('utf-8').rstrip()
-
-            # if line.startswith("⚊") or "⚊" in line:
-            #     text.delete('end - %d chars' % (len(previous_line) + 2), 'end-1c')
-
-            # text.insert(tk.END, line + '\n')
-            self.ui.OutputBrowser.append(line)
+        self.ui.OutputBrowser.append("Reading " + self.ifile + "...")
 
-    def make_run(self):
-        # pylint: disable=too-complex
+        task = PreviewTask(self.ifile)
+        task.signals.ready.connect(self.show_preview)
+        task.signals.failed.connect(self.preview_failed)
+        QtCore.QThreadPool.globalInstance().start(task)
 
-        command = 'python main.py '
-
-        if self.ifile == '':
+    def show_preview(self, path: str, preview: dict):
+        # file opened after this one was asked for wins
+        if path != self.ifile:
             return
 
-        command += self.ifile + ' '
-
-        if self.ui.headerEdit.text().isnumeric():
-            command += '-h ' + self.ui.headerEdit.text() + ' '
-
-        if self.ui.checkBox.isChecked():
-            command += '-v '
-
-        command += '-d ' + self.ui.XEdit.text() + ',' + self.ui.YEdit.text() + ',' + \
-            self.ui.ZEdit.text() + ' '
-
-        command += '-j '
-        if self.ui.basic2Button.isChecked():
-            command += 'basic2d,'
-
-        if self.ui.basic2pButton.isChecked():
-            command += 'basic2d_paral,'
-
-        if self.ui.basic3Button.isChecked():
-            command += 'basic3d,'
-
-        if self.ui.basic3pButton.isChecked():
-            command += 'basic3d_paral,'
-
-        if self.ui.basicGaussButton.isChecked():
-            command += 'gauss,'
-
-        if self.ui.plot2dButton.isChecked():
-            command += 'plot2d,'
-
-        if self.ui.plot3dButton.isChecked():
-            command += 'scatter3d,'
-
-        command = command[:-1] + ' '
-
-        command += '-c ' + '"' + self.ui.ColEdit.text() + '" '
-
-        command += '-r ' + self.ui.RadiusEdit.text() + ' -i ' + self.ui.IterEdit.text()
-
-        if self.ui.OutputEdit.text() != '':
-            command += ' -o ' + self.ui.OutputEdit.text()
-
-        return command
-
-
-app = QtWidgets.QApplication([])
-application = AveragerGUI()
-application.show()
+        self.ui.OutputBrowser.clear()
+        self.ui.OutputBrowser.append(preview["head"].head(PREVIEW_SHOWN_ROWS).to_string())
+        rows = str(preview["rows"]) if preview["exact"] else f"~{preview['rows']}"
+        self.ui.OutputBrowser.append(f"\n{rows} rows, {len(preview['columns'])} columns")
+        for name, stats in preview["stats"].items():
+            self.ui.OutputBrowser.append(f"{name}: min {stats['min']:.6g}, "
+                                         f"max {stats['max']:.6g}, mean {stats['mean']:.6g}")
+
+        self.ui.ColEdit.setText(",".join(name for name in preview["columns"]
+                                         if name.lower() not in COORDINATES))
+        if preview["dimensions"] is not None:
+            # sizes preview couldnt get exactly are left for user to fill in
+            i, j, k = preview["dimensions"]
+            self.ui.XEdit.setText(str(i))
+            self.ui.YEdit.setText("" if j is None else str(j))
+            self.ui.ZEdit.setText(str(k) if k else "")
+
+    def preview_failed(self, path: str, error: str):
+        if path == self.ifile:
+            self.ui.OutputBrowser.append("Cannot read " + path + ": " + error)
+
+    def make_run(self) -> dict:
+        """Task for AveragingWorker.run from the form, None if form is incomplete"""
 
-sys.exit(app.exec())
+        if self.ifile == '':
+            return None
+
+        try:
+            dimensions = (int(self.ui.XEdit.text()), int(self.ui.YEdit.text()),
+                          int(self.ui.ZEdit.text() or 0))
+            radius, iterations = int(self.ui.RadiusEdit.text()), int(self.ui.IterEdit.text())
+        except ValueError:
+            self.ui.OutputBrowser.append("Dimensions, radius and iterations must be numbers!")
+            return None
+
+        return {
+            "path": self.ifile,
+            "dimensions": dimensions,
+            "jobs": [job for button, job in JOB_BUTTONS.items()
+                     if getattr(self.ui, button).isChecked()],
+            "columns": self.ui.ColEdit.text().split(","),
+            "radius": radius,
+            "iterations": iterations,
+            "outfile": self.ui.OutputEdit.text(),
+            "verbose": self.ui.checkBox.isChecked(),
+        }
+
+
+if __name__ == '__main__':
+    # guarded, as worker processes import main module of GUI too
+    app = QtWidgets.QApplication([])
+    application = AveragerGUI()
+    application.show()
+
+    sys.exit(app.exec())
@@ -0,0 +1,142 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, spans go without memory there
+    resource = None
+
+_profiler = None
+_disabled = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Collects spans: named stretches of work with wall time, CPU time of the whole
+    process, peak resident memory of the process so far and how much the span raised
+    that peak. Spans nest, and are written as Chrome trace complete events, which
+    Perfetto and chrome://tracing open as they are.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, wall: float, cpu: float,
+               rss_before: int, rss_after: int, args: dict):
+        """Adds finished span, times are in seconds of time.perf_counter, rss in KB
+        or None where peak_rss cant measure it"""
+        memory = {}
+        if rss_before is not None and rss_after is not None:
+            # ru_maxrss is high-water mark of the whole process, only its rise is the span's
+            memory = {"process_peak_rss_mb": rss_after / 1024,
+                      "peak_rss_growth_mb": (rss_after - rss_before) / 1024}
+        event = {"name": name, "ph": "X", "pid": self.pid, "tid": threading.get_ident(),
+                 "ts": (start - self._origin) * 1e6, "dur": wall * 1e6,
+                 "args": dict(args, cpu_s=cpu, **memory)}
+        with self._lock:
+            self.events.append(event)
+
+    def write_trace(self, path: str):
+        """Writes spans as Chrome trace json"""
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+    def summary(self) -> list:
+        """
+        Totals of spans by name, spans with "column" argument are counted per column.
+        Returns:
+            list: dicts with "stage", "calls", "wall", "cpu" seconds, "process_peak_rss_mb"
+                  when stage last ended and largest "peak_rss_growth_mb" of its spans, both
+                  None if memory wasnt measured, in order stages first started
+        """
+        stages = {}
+        for event in sorted(self.events, key=lambda event: event["ts"]):
+            stage = event["name"]
+            if "column" in event["args"]:
+                stage += f"[{event['args']['column']}]"
+            total = stages.setdefault(stage, {"stage": stage, "calls": 0, "wall": 0.0,
+                                              "cpu": 0.0, "process_peak_rss_mb": None,
+                                              "peak_rss_growth_mb": None})
+            total["calls"] += 1
+            total["wall"] += event["dur"] / 1e6
+            total["cpu"] += event["args"]["cpu_s"]
+            if "process_peak_rss_mb" in event["args"]:
+                total["process_peak_rss_mb"] = max(total["process_peak_rss_mb"] or 0.0,
+                                                   event["args"]["process_peak_rss_mb"])
+                total["peak_rss_growth_mb"] = max(total["peak_rss_growth_mb"] or 0.0,
+                                                  event["args"]["peak_rss_growth_mb"])
+        return list(stages.values())
+
+    def format_summary(self) -> str:
+        """Summary as text table"""
+        rows = self.summary()
+        width = max([len("stage")] + [len(row["stage"]) for row in rows])
+        lines = [f"{'stage':<{width}} {'calls':>6} {'wall s':>10} {'cpu s':>10} "
+                 f"{'peak rise MB':>12} {'process peak MB':>15}"]
+        for row in rows:
+            growth, peak = ("-" if row[key] is None else f"{row[key]:.1f}"
+                            for key in ["peak_rss_growth_mb", "process_peak_rss_mb"])
+            lines.append(f"{row['stage']:<{width}} {row['calls']:>6} {row['wall']:>10.4f} "
+                         f"{row['cpu']:>10.4f} {growth:>12} {peak:>15}")
+        return "\n".join(lines)
+
+
+def enable() -> Profiler:
+    """Starts collecting spans into new Profiler and returns it"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable() -> Profiler:
+    """Stops collecting spans and returns Profiler that collected them, None if none did"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def active() -> Profiler:
+    """Profiler collecting spans, None if profiling is off"""
+    return _profiler
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process in KB, None where resource module is missing"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextlib.contextmanager
+def _span(profiler: Profiler, name: str, args: dict):
+    rss_before = peak_rss()
+    start, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+        profiler.record(name, start, wall, cpu, rss_before, peak_rss(), args)
+
+
+def span(name: str, **args):
+    """
+    Context manager timing work inside it as span of active Profiler. With
+    profiling off it is a shared no-op context, so calls may stay in hot loops.
+
+        with profiling.span("average", column="u"):
+            ...
+
+    Args:
+        name (str): stage name
+        args: values shown with span in trace, "column" also splits summary
+    """
+    if _profiler is None:
+        return _disabled
+    return _span(_profiler, name, args)
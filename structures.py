@@ -1,143 +1,911 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from multiprocessing import shared_memory
 import pandas as pd
 import numpy as np
 
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "field_averaging")
+CACHE_LIMIT = 8 * 2 ** 30  # bytes of cached columns kept, least recently used go first
+FINGERPRINT_BLOCK = 2 ** 20
+FINGERPRINT_SAMPLES = 16
+PLT_CHUNK = 16 * 2 ** 20  # bytes of numeric text converted at once
+WRITE_CHUNK = 65536  # rows formatted at once by write_rows
+CSV_CHUNK = 64 * 2 ** 20  # bytes of csv parsed by one task of read_csv_columns
+CSV_SAMPLE_ROWS = 1000  # rows parsed up front to find dtypes of columns
+PREVIEW_ROWS = 1000  # first rows of csv read by preview_csv
+PREVIEW_SAMPLES = 8  # blocks read at evenly spaced offsets by preview_csv
+PREVIEW_SAMPLE_BYTES = 65536
+PREVIEW_COUNT_BYTES = 2 ** 30  # files up to that size get rows counted exactly by preview_csv
 
-class StreamData:
-    """Field information class"""
-    dataset = pd.DataFrame()
-    i, j, k = 0, 0, 0
 
-    def __init__(self, csvstr: str, i: int, j: int, k: int = 0):
-        # TODO: Check for correct data it should be csv-string
-        self.dataset = pd.read_csv(csvstr)
-        self.i = i
-        self.j = j
-        self.k = k
+def file_fingerprint(path: str) -> str:
+    """Hashes size, head, tail and evenly spaced samples of file, without reading all of it
+
+    Args:
+        path (str): path to file
+
+    Returns:
+        str: hex digest
+    """
+
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as file:
+        digest.update(file.read(FINGERPRINT_BLOCK))
+        for sample in range(1, FINGERPRINT_SAMPLES + 1):
+            file.seek(max(0, size * sample // (FINGERPRINT_SAMPLES + 1) - FINGERPRINT_BLOCK // 256))
+            digest.update(file.read(FINGERPRINT_BLOCK // 128))
+        file.seek(max(0, size - FINGERPRINT_BLOCK))
+        digest.update(file.read(FINGERPRINT_BLOCK))
+    return digest.hexdigest()
+
+
+def _cache_entry(path: str, part: str = "", dtype=np.float64) -> tuple:
+    """Cache directory of input file and metadata it has to match"""
+
+    stat = os.stat(path)
+    key = {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime_ns,
+           "fingerprint": file_fingerprint(path), "part": part, "dtype": np.dtype(dtype).str}
+    return os.path.join(CACHE_DIR, _cache_name(key["path"], part, dtype)), key
 
 
-def parse_plt(path: str) -> StreamData:
-    """Parses .plt file
+def _cache_name(path: str, part: str, dtype=np.float64) -> str:
+    # one entry per input path and float dtype, so stale cache of changed file gets replaced
+    name = path + "\n" + part + "\n" + np.dtype(dtype).str
+    return hashlib.blake2b(name.encode(), digest_size=16).hexdigest()
+
+
+def _cached_meta(entry: str, key: dict) -> dict:
+    """Metadata of cache entry, None if there is no entry or it was made of other file"""
+
+    try:
+        with open(os.path.join(entry, "meta.json")) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("key") == key else None
+
+
+def load_cached(path: str, part: str = "", columns: list = None, dtype=np.float64) -> dict:
+    """Maps cached columns of input file back without parsing
 
     Args:
-        path (str): path to plt file
+        path (str): path to input file the cache was made from
+        part (str, optional): which part of file, like plt zone, was cached
+        columns (list, optional): names of columns to map, all cached ones if None
+        dtype (optional): float dtype floating columns were cached in. Defaults to float64.
 
     Returns:
-        StreamData: parsed StreamData
+        dict: "schema" with names of all columns of input, "columns" with those of
+              requested ones that are cached, as memory-mapped read-only arrays,
+              and "i", "j", "k" sizes. None if there is no valid cache of the file
     """
 
-    csvstr = ''
-    i, j = 0, 0
-    with open(path, "r") as file:
-        first = file.readline()
-        first = first.replace(',', ' ')
-        first = first.replace('"', ' ')
+    entry, key = _cache_entry(path, part, dtype)
+    meta = _cached_meta(entry, key)
+    if meta is None:
+        return None
 
-        vars = first.split()[2:]
-        for v in vars:
-            csvstr += v + ','
+    names = [name for name in (meta["files"] if columns is None else columns)
+             if name in meta["files"]]
+    try:
+        mapped = {name: np.load(os.path.join(entry, meta["files"][name]), mmap_mode='r')
+                  for name in names}
+    except (OSError, ValueError):
+        return None
+
+    # mark as recently used for eviction
+    os.utime(os.path.join(entry, "meta.json"))
+    return {"schema": meta["schema"], "columns": mapped,
+            "i": meta["i"], "j": meta["j"], "k": meta["k"]}
+
+
+def store_cached(path: str, columns: dict, i: int, j: int, k: int = 0, part: str = "",
+                 schema: list = None, dtype=np.float64):
+    """Adds parsed columns of input file to its cache as .npy files with shape metadata,
+    then evicts least recently used entries above CACHE_LIMIT. Columns cached
+    before for the same file are kept, so entry may be filled column by column.
+
+    Args:
+        path (str): path to input file columns were parsed from
+        columns (dict): column name to 1d array
+        i, j, k (int): field dimensions
+        part (str, optional): which part of file, like plt zone, columns are of
+        schema (list, optional): names of all columns of input, columns keys if None
+        dtype (optional): float dtype floating columns are cached in. Defaults to float64.
+    """
 
-        csvstr = csvstr[:-1]
-        csvstr += '\n'
+    entry, key = _cache_entry(path, part, dtype)
+    meta = _cached_meta(entry, key)
+    if meta is None:
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry)
+        meta = {"key": key, "schema": list(schema or columns), "files": {}}
+    meta.update(i=i, j=j, k=k)
 
-        second = file.readline()
-        second = second.replace('=', ' ')
-        second = second.replace(',', ' ')
+    # every file is written aside and renamed, so readers see whole files only
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype == object:
+            values = values.astype(str)
+        elif values.dtype.kind == 'f':
+            values = values.astype(dtype, copy=False)
+        index = meta["schema"].index(name) if name in meta["schema"] else len(meta["files"])
+        file_name = f"{index}.npy"
+        with open(os.path.join(entry, file_name + ".tmp"), "wb") as file:
+            np.save(file, values)
+        os.replace(os.path.join(entry, file_name + ".tmp"), os.path.join(entry, file_name))
+        meta["files"][name] = file_name
 
-        ij = second.split()
-        i = int(ij[2])
-        j = int(ij[4])
+    with open(os.path.join(entry, "meta.json.tmp"), "w") as file:
+        json.dump(meta, file)
+    os.replace(os.path.join(entry, "meta.json.tmp"), os.path.join(entry, "meta.json"))
 
-        for k in range(i * j):
-            s = file.readline()
-            s = s.replace("\t", ',')
-            csvstr += s
+    evict_cache(CACHE_LIMIT)
 
-    return StreamData(csvstr, i, j)
 
+def drop_cached(path: str, part: str = "", dtype=np.float64):
+    """Removes cache entry of input file"""
 
-def output_plt(data: StreamData, original_file: str, new_file: str, header=2):
-    """Outputs StreamData to file
+    entry = os.path.join(CACHE_DIR, _cache_name(os.path.abspath(path), part, dtype))
+    shutil.rmtree(entry, ignore_errors=True)
+
+
+def evict_cache(limit: int):
+    """Removes least recently used cache entries until they take no more than limit bytes
 
     Args:
-        data (StreamData): Actual StreamData to output
-        original_file (str): Path to Original .plt file program got data from
-        new_file (str): Path to New .plt file
-        header (int, optional): Number of header strings. Defaults to 2.
+        limit (int): bytes cached columns may take
     """
 
-    with open(original_file, "r") as fo:
-        with open(new_file, "w") as fn:
+    if not os.path.isdir(CACHE_DIR):
+        return
 
-            for i in range(header):
-                line = fo.readline()
-                fn.write(line)
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        entry = os.path.join(CACHE_DIR, name)
+        meta = os.path.join(entry, "meta.json")
+        if not os.path.isfile(meta):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+        entries.append((os.path.getmtime(meta), size, entry))
 
-            for i in data.dataset.values:
-                flag = True
-                for j in i:
-                    if not flag:
-                        fn.write("\t")
-                    else:
-                        flag = False
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
 
-                    fn.write(str(j))
-                fn.write("\n")
 
+def _csv_ranges(path: str, chunk: int) -> list:
+    """Byte ranges of csv rows after header, about chunk long, starting and ending on line ends"""
 
-def advance_to_column(data: StreamData, column_name: str) -> np.array:
-    """Outputs 2D or 3D list of column setting"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        file.readline()
+        bounds = [file.tell()]
+        while bounds[-1] < size:
+            file.seek(bounds[-1] + chunk)
+            file.readline()
+            bounds.append(min(file.tell(), size))
+    return list(zip(bounds[:-1], bounds[1:]))
 
-    column = data.dataset[column_name]
 
-    # Create a list to hold the data
-    data_list = []
+def _read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as file:
+        file.seek(start)
+        return file.read(end - start)
 
-    # Iterate over the rows of the column and append each value to the list
-    data_list.append(column)
 
-    # Check if z_dim is 0, return 2D list
-    if data.k == 0:
-        # Reshape the list into a 2D list with x and y dimensions
-        x_dim = data.i
-        y_dim = data.j
+def _count_csv_rows(task) -> int:
+    """Worker side of read_csv_columns: number of lines in byte range"""
+    text = _read_range(*task)
+    return text.count(b"\n") + (len(text) > 0 and not text.endswith(b"\n"))
+
 
-        data_2d = np.reshape(np.asarray(data_list), (y_dim, x_dim))
+def _parse_csv_range(task) -> int:
+    """
+    Worker side of read_csv_columns. Parses byte range of csv and writes its columns
+    into rows [offset, offset + rows) of shared column arrays attached by name
+    """
+    path, start, end, offset, rows, schema, targets = task
+    frame = pd.read_csv(io.BytesIO(_read_range(path, start, end)), header=None, names=schema,
+                        usecols=list(targets),
+                        dtype={name: dtype for name, (_, dtype, _) in targets.items()})
+    if len(frame) != rows:
+        # blank lines or quoted line breaks, rows can't be placed by counting lines
+        raise ValueError(f"{path}: {len(frame)} rows parsed in bytes {start}:{end} "
+                         f"with {rows} lines")
+
+    for name, (shm_name, dtype, total) in targets.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            column = np.ndarray((total,), dtype=dtype, buffer=shm.buf)
+            column[offset:offset + rows] = frame[name].to_numpy()
+            del column
+        finally:
+            shm.close()
+    return rows
+
+
+def _read_csv_parallel(path: str, names: list, workers: int, dtype) -> dict:
+    schema = [str(name) for name in pd.read_csv(path, nrows=0).columns]
+    sample = pd.read_csv(path, usecols=names, nrows=CSV_SAMPLE_ROWS)
+    dtypes = {name: sample[name].dtype for name in names}
+    if any(kind.kind not in "iuf" for kind in dtypes.values()):
+        raise ValueError(f"{path}: only numeric columns are parsed in parallel")
+    dtypes = {name: np.dtype(dtype) if kind.kind == 'f' else kind
+              for name, kind in dtypes.items()}
+
+    ranges = _csv_ranges(path, CSV_CHUNK)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with context.Pool(processes=min(workers, len(ranges))) as pool:
+        counts = pool.map(_count_csv_rows, [(path, start, end) for start, end in ranges])
+        total = sum(counts)
+        offsets = np.cumsum([0] + counts[:-1]).tolist()
+
+        shared = {}
+        try:
+            for name in names:
+                shared[name] = shared_memory.SharedMemory(
+                    create=True, size=max(1, total * dtypes[name].itemsize))
+            targets = {name: (shared[name].name, dtypes[name].str, total) for name in names}
+            pool.map(_parse_csv_range, [(path, start, end, offset, rows, schema, targets)
+                                        for (start, end), offset, rows
+                                        in zip(ranges, offsets, counts)])
+
+            # one column at a time leaves shared memory, so peak is one column above result
+            columns = {}
+            for name in names:
+                columns[name] = np.ndarray((total,), dtype=dtypes[name],
+                                           buffer=shared[name].buf).copy()
+                shared.pop(name).unlink()
+        finally:
+            for shm in shared.values():
+                shm.close()
+                shm.unlink()
+    return columns
+
+
+def read_csv_columns(path: str, names: list, workers: int = None, stats: dict = None,
+                     dtype=np.float64) -> dict:
+    """Parses columns of csv file. Files longer than CSV_CHUNK are split into line-aligned
+    byte ranges which worker processes parse straight into shared column arrays,
+    in order of the file. Text columns, blank lines and quoted line breaks fall back
+    to a single pandas pass. Workers are started by forkserver or spawn, which import
+    the main module of the program, so scripts calling it must guard top-level code
+    with if __name__ == "__main__".
+
+    Args:
+        path (str): path to csv file with header line
+        names (list): names of columns to parse
+        workers (int, optional): number of worker processes, all CPUs if None,
+                                 0 or 1 parse in this process
+        stats (dict, optional): gets "bytes" of file, "seconds", "mb_per_s" and
+                                "workers" that parsed it
+        dtype (optional): dtype of floating columns. Defaults to float64.
+
+    Returns:
+        dict: column name to writable 1d array
+    """
 
-        # Return the result as 2D list
-        return data_2d
+    workers = os.cpu_count() if workers is None else workers
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+
+    columns = None
+    if workers > 1 and size > CSV_CHUNK:
+        try:
+            columns = _read_csv_parallel(path, names, workers, dtype)
+        except ValueError:
+            workers = 1
+    if columns is None:
+        workers = 1
+        frame = pd.read_csv(path, usecols=names)
+        columns = {name: frame[name].to_numpy() for name in names}
+        del frame
+        for name, values in columns.items():
+            if values.dtype.kind == 'f' and values.dtype != dtype:
+                # one column at a time is narrowed, so peak is one column above parsed ones
+                values = columns[name] = values.astype(dtype)
+            # frame is dropped, so its read-only copy-on-write views are ours to write
+            values.flags.writeable = True
+
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        stats.update(bytes=size, seconds=seconds, workers=workers,
+                     mb_per_s=size / 2 ** 20 / max(seconds, 1e-9))
+    return columns
+
+
+def _line_at(file, offset: int) -> tuple:
+    """Start offset and text of the first whole line starting at or after offset"""
+
+    file.seek(max(0, offset - 1))
+    if offset > 0:
+        file.readline()
+    return file.tell(), file.readline()
+
+
+def _first_change_row(file, start: int, row: int, column: int) -> int:
+    """Index of the first row whose value in column differs from the one of line at start
+    byte, which is row number row, or number of rows if none differs. Lines are bisected
+    by byte offsets, so it is meant for columns constant in long runs, like z of a grid
+    whose x-y plane is longer than preview head"""
+
+    def value(line: bytes) -> float:
+        try:
+            return float(line.split(b",")[column])
+        except (IndexError, ValueError):
+            return None
+
+    size = file.seek(0, os.SEEK_END)
+    first = value(_line_at(file, start)[1])
+    # line at lo has the first value, the first differing line starts at or before hi
+    lo, hi = start, size
+    while hi - lo > PREVIEW_SAMPLE_BYTES:
+        line_start, line = _line_at(file, (lo + hi) // 2)
+        if line_start >= hi:
+            break
+        if value(line) == first:
+            lo = line_start
+        else:
+            hi = line_start
+
+    file.seek(lo)
+    position = lo
+    for line in iter(file.readline, b""):
+        if value(line) != first:
+            break
+        position += len(line)
+
+    # rows before the differing line are counted in its bytes, not parsed
+    file.seek(start)
+    while file.tell() < position:
+        row += file.read(min(PREVIEW_SAMPLE_BYTES * 16, position - file.tell())).count(b"\n")
+    return row
+
+
+def _count_rows(file, start: int) -> int:
+    """Number of lines from start byte to the end of file, trailing blank ones left out.
+    Newlines are counted in blocks, lines are not parsed"""
+
+    size = file.seek(0, os.SEEK_END)
+    tail = max(start, size - PREVIEW_SAMPLE_BYTES)
+    file.seek(tail)
+    end = tail + len(file.read().rstrip())
+    if end <= start:
+        return 0
+
+    rows = 1
+    file.seek(start)
+    while file.tell() < end:
+        rows += file.read(min(PREVIEW_SAMPLE_BYTES * 16, end - file.tell())).count(b"\n")
+    return rows
+
+
+def _grid_dimensions(head: pd.DataFrame, rows: int, runs: dict = None,
+                     exact: bool = True) -> tuple:
+    """Dimensions (i, j, k) of grid from its x, y and z columns, where x changes fastest,
+    k is 0 without z column. runs are rows of the first y or z value, for columns
+    constant all over head. Sizes following from number of rows are None unless it
+    is exact and divisible by the rest. None if dimensions cant be seen or there is no x"""
+
+    coordinates = {str(name).lower(): name for name in head.columns}
+    if "x" not in coordinates:
+        return None
+
+    def period(values: np.ndarray) -> int:
+        repeats = np.flatnonzero(values[1:] == values[0])
+        return int(repeats[0]) + 1 if len(repeats) else None
+
+    def remaining(size: int) -> int:
+        return rows // size if exact and rows % size == 0 else None
+
+    runs = runs or {}
+    i = period(head[coordinates["x"]].to_numpy()) or runs.get("y")
+    if i is None:
+        return None
+    if "y" not in coordinates:
+        return i, remaining(i), 0
+    j = period(head[coordinates["y"]].to_numpy()[::i])
+    if "z" not in coordinates:
+        return i, j or remaining(i), 0
+    if j is None:
+        plane = runs.get("z")
+        if plane is None or plane % i:
+            return None
+        j = plane // i
+    return i, j, remaining(i * j)
+
+
+def preview_csv(path: str, rows: int = PREVIEW_ROWS, samples: int = PREVIEW_SAMPLES) -> dict:
+    """Quick look at csv file whatever its size: header and first rows are parsed, column
+    stats are estimated from blocks read at evenly spaced byte offsets. Rows are counted
+    exactly in files up to PREVIEW_COUNT_BYTES, and estimated from the blocks in bigger ones.
 
+    Args:
+        path (str): path to csv file with header line
+        rows (int, optional): first rows to read. Defaults to PREVIEW_ROWS.
+        samples (int, optional): blocks of PREVIEW_SAMPLE_BYTES to sample. Defaults to
+                                 PREVIEW_SAMPLES.
+
+    Returns:
+        dict: "columns" names, "head" DataFrame of first rows, "rows" count, "exact"
+              whether count is exact, "stats" column name to "min", "max" and "mean"
+              of sampled rows of numeric columns, "dimensions" (i, j, k) of grid
+              guessed from x, y and z columns or None, j or k is None when it
+              follows from rows count, which isnt exact
+    """
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        header = file.readline()
+        lines = [line for line in (file.readline() for _ in range(rows)) if line.strip()]
+        head_end = file.tell()
+
+        blocks = []
+        if head_end < size:
+            for offset in np.linspace(head_end, size, samples, endpoint=False).astype(int):
+                file.seek(offset)
+                file.readline()
+                block = file.read(PREVIEW_SAMPLE_BYTES)
+                # only whole lines are kept
+                blocks.append(block[:block.rfind(b"\n") + 1])
+
+        head = pd.read_csv(io.BytesIO(header + b"".join(lines)))
+        # y or z run longer than head, like x-y plane of big grid, is found in the file
+        coordinates = [str(name).lower() for name in head.columns]
+        runs = {}
+        for name in ["y", "z"]:
+            if name in coordinates and len(head):
+                values = head.iloc[:, coordinates.index(name)]
+                if (values == values.iloc[0]).all():
+                    runs[name] = len(head) if head_end >= size else \
+                        _first_change_row(file, len(header), 0, coordinates.index(name))
+
+        count = None
+        exact = not blocks or size <= PREVIEW_COUNT_BYTES
+        if blocks and exact:
+            count = len(lines) + _count_rows(file, head_end)
+
+    frame = head
+    if blocks:
+        sampled = b"".join(blocks)
+        if count is None:
+            bytes_per_row = (head_end - len(header) + len(sampled)) / \
+                max(1, len(lines) + sampled.count(b"\n"))
+            count = round((size - len(header)) / bytes_per_row)
+        if sampled.strip():
+            frame = pd.concat([head, pd.read_csv(io.BytesIO(sampled), header=None,
+                                                 names=list(head.columns))])
+    else:
+        count = len(head)
+
+    stats = {str(name): {"min": float(values.min()), "max": float(values.max()),
+                         "mean": float(values.mean())}
+             for name, values in frame.items() if values.dtype.kind in "biuf" and len(values)}
+    return {"columns": [str(name) for name in head.columns], "head": head, "rows": count,
+            "exact": exact, "stats": stats,
+            "dimensions": _grid_dimensions(head, count, runs, exact)}
+
+
+def _csv_loader(path: str, i: int, j: int, k: int, cache: bool, rebuild_cache: bool,
+                workers: int, stats: dict, dtype) -> tuple:
+    """Schema of csv file and function loading its columns by names, through the cache"""
+
+    if rebuild_cache:
+        drop_cached(path, dtype=dtype)
+
+    cached = load_cached(path, columns=[], dtype=dtype) if cache else None
+    if cached is not None:
+        schema = cached["schema"]
     else:
-        # Reshape the list into a 3D list with x, y, and z dimensions
-        x_dim = data.i
-        y_dim = data.j
-        z_dim = data.k
+        schema = [str(name) for name in pd.read_csv(path, nrows=0).columns]
+
+    def load(names: list) -> dict:
+        columns = {}
+        if cache:
+            cached = load_cached(path, columns=names, dtype=dtype)
+            if cached is not None:
+                columns.update(cached["columns"])
 
-        # data_3d = [[data_list[z * num_rows * y_dim + y * y_dim + x] for x in range(x_dim)]
-        #            for y in range(y_dim) for z in range(z_dim)]
+        missing = [name for name in names if name not in columns]
+        if missing:
+            # only requested columns are converted, the rest of every line is skipped
+            parsed = read_csv_columns(path, missing, workers, stats, dtype)
+            if cache:
+                store_cached(path, parsed, i, j, k, schema=schema, dtype=dtype)
+            columns.update(parsed)
+        return columns
 
-        data_3d = np.reshape(np.asarray(data_list), (z_dim, y_dim, x_dim))
+    return schema, load
 
-        # Return the result as 3D list
-        return data_3d
+
+class StreamData:
+    """Field information class: schema of input is read up front, columns are loaded
+    on first access and kept as contiguous typed NumPy arrays"""
+
+    __slots__ = ("i", "j", "k", "dtype", "schema", "ingest", "_arrays", "_loader")
+
+    def __init__(self, csvstr, i: int, j: int, k: int = 0, dtype=np.float64,
+                 cache: bool = True, rebuild_cache: bool = False, workers: int = None):
+        """
+        Args:
+            csvstr: path to csv file, which is read lazily through the binary cache,
+                    buffer with csv, DataFrame or dict of column name to 1d array
+            i, j, k (int): field dimensions, k is 0 for 2d fields
+            dtype (optional): float dtype of field columns. Defaults to float64.
+            cache (bool, optional): use and fill the cache. Defaults to True.
+            rebuild_cache (bool, optional): drop cache of file and parse it again.
+            workers (int, optional): processes parsing csv, see read_csv_columns.
+        """
+
+        self.i = i
+        self.j = j
+        self.k = k
+        self.dtype = np.dtype(dtype)
+        self._loader = None
+        # stats of last csv parse, see read_csv_columns. Empty if columns came from cache
+        self.ingest = {}
+
+        if isinstance(csvstr, str) and os.path.isfile(csvstr):
+            self.schema, self._loader = _csv_loader(csvstr, i, j, k, cache, rebuild_cache,
+                                                    workers, self.ingest, self.dtype)
+            self._arrays = {}
+            return
+
+        if not isinstance(csvstr, (dict, pd.DataFrame)):
+            csvstr = pd.read_csv(csvstr)
+        if isinstance(csvstr, pd.DataFrame):
+            # frame stays with caller, columns are copied so they can be updated in place
+            csvstr = {str(name): csvstr[name].to_numpy(copy=True) for name in csvstr.columns}
+        self.schema = list(csvstr)
+        self._arrays = dict(csvstr)
+
+    def load(self, names: list = None):
+        """Loads columns which are not loaded yet, all of them if names is None"""
+
+        names = self.schema if names is None else names
+        unknown = [name for name in names if name not in self.schema]
+        if unknown:
+            raise KeyError("No such columns: " + ", ".join(unknown))
+
+        missing = [name for name in names if name not in self._arrays]
+        if missing and self._loader is not None:
+            self._arrays.update(self._loader(missing))
+
+    def column(self, name: str) -> np.ndarray:
+        """Flat column, floating ones in dtype of StreamData. Same array is returned
+        every time, so writes to it are writes to the column"""
+
+        self.load([name])
+        values = self._arrays[name]
+        # floats passed in by caller may be of other dtype, convert them on first access
+        if values.dtype.kind == 'f' and values.dtype != self.dtype:
+            values = self._arrays[name] = values.astype(self.dtype)
+        return values
+
+    def set_column(self, name: str, values: np.ndarray):
+        """Writes values into column buffer in place when it is writable and has dtype
+        of StreamData, otherwise the column gets values as new buffer"""
+
+        values = np.reshape(values, -1)
+        current = self._arrays.get(name)
+        if current is not None and current.dtype == self.dtype and current.flags.writeable \
+                and current.shape == values.shape:
+            np.copyto(current, values)
+        else:
+            self._arrays[name] = np.ascontiguousarray(values, dtype=self.dtype)
+        if name not in self.schema:
+            self.schema.append(name)
+
+    def arrays(self, names: list = None) -> dict:
+        """Column name to flat column of given columns, all of them if names is None"""
+
+        names = self.schema if names is None else names
+        self.load(names)
+        return {name: self.column(name) for name in names}
+
+    def to_pandas(self, names: list = None) -> pd.DataFrame:
+        """Exports given columns, all of them if names is None, as DataFrame without copies"""
+
+        return pd.DataFrame(self.arrays(names), copy=False)
+
+    @property
+    def dataset(self) -> pd.DataFrame:
+        """All columns as DataFrame, same as to_pandas(). Read-only, columns are
+        changed through set_column"""
+
+        return self.to_pandas()
+
+
+_PLT_KEYWORD = re.compile(rb'^[ \t]*[A-Za-z"]', re.M)
+_PLT_PARAMETER = re.compile(r'(\w+)\s*=\s*("[^"]*"|\([^)]*\)|[^,\s]+)')
+_PLT_NAME = re.compile(r'"([^"]*)"|([^\s,"]+)')
+_PLT_SEPARATORS = bytes.maketrans(b',', b' ')
+_PLT_NUMERIC = b'0123456789+-.eE, \t\r\n'
+_PLT_SECTIONS = ["TITLE", "VARIABLES", "ZONE", "DATASETAUXDATA", "TEXT", "GEOMETRY"]
+
+
+def _plt_header(lines: list, variables: list) -> tuple:
+    """Parses header lines before zone data into variable names and zone parameters"""
+
+    sections = []
+    for line in lines:
+        keyword = re.match(r'\s*([A-Za-z]+)\s*=?', line)
+        if keyword is not None and keyword.group(1).upper() in _PLT_SECTIONS:
+            sections.append([keyword.group(1).upper(), line[keyword.end():]])
+        elif sections:
+            sections[-1][1] += " " + line
+
+    zone = {}
+    for name, text in sections:
+        if name == "VARIABLES":
+            variables = [quoted or plain for quoted, plain in _PLT_NAME.findall(text)]
+        elif name == "ZONE":
+            zone = {key.upper(): value.strip('"') for key, value in _PLT_PARAMETER.findall(text)}
+    return variables, zone
+
+
+def _store_plt_values(columns: np.ndarray, offset: int, values: np.ndarray, block: bool):
+    """Puts values starting at offset of zone data straight into (variables, points) columns"""
+
+    if block:
+        columns.reshape(-1)[offset:offset + values.size] = values
+        return
+
+    # point format interleaves variables: finish started point, copy whole ones, then the rest
+    count = columns.shape[0]
+    head = min(values.size, (-offset) % count)
+    for index in range(head):
+        columns[(offset + index) % count, (offset + index) // count] = values[index]
+    offset += head
+    whole = (values.size - head) // count
+    first = offset // count
+    columns[:, first:first + whole] = values[head:head + whole * count].reshape(whole, count).T
+    for index in range(head + whole * count, values.size):
+        position = offset + index - head
+        columns[position % count, position // count] = values[index]
+
+
+def read_plt_zones(path: str, dtype=np.float64) -> list:
+    """Streams ASCII Tecplot file zone by zone. Numeric text is converted in PLT_CHUNK
+    pieces straight into preallocated column arrays, so it is never held whole
+    in memory. POINT and BLOCK data packing and I, J, K zones are supported.
+
+    Args:
+        path (str): path to plt file
+        dtype (optional): dtype of columns. Defaults to float64.
+
+    Returns:
+        list: dicts with zone "title", "columns" (variable name to column of dtype)
+              and "i", "j", "k" sizes, k is 0 for 2d zones
+    """
+
+    zones = []
+    variables = []
+    with open(path, "rb") as file:
+        while True:
+            lines = []
+            line = file.readline()
+            while line and (not line.strip() or _PLT_KEYWORD.match(line)):
+                lines.append(line.decode())
+                line = file.readline()
+            if not line:
+                break
+
+            variables, zone = _plt_header(lines, variables)
+            i, j, k = (int(zone.get(size, 1)) for size in ["I", "J", "K"])
+            block = "BLOCK" in (zone.get("DATAPACKING", "") + zone.get("F", "")).upper()
+            columns = np.empty((len(variables), i * j * k), dtype=dtype)
+
+            offset = 0
+            text = line
+            while offset < columns.size:
+                if text is None:
+                    text = file.read(PLT_CHUNK)
+                    if not text:
+                        raise ValueError(f"{path}: zone {len(zones)} ends after {offset} "
+                                         f"of {columns.size} values")
+                    text += file.readline()
+                    # next zone header may start inside the piece, leave it to be read again
+                    keyword = _PLT_KEYWORD.search(text) if text.translate(None, _PLT_NUMERIC) \
+                        else None
+                    if keyword is not None:
+                        file.seek(keyword.start() - len(text), os.SEEK_CUR)
+                        text = text[:keyword.start()]
+
+                if b',' in text:
+                    text = text.translate(_PLT_SEPARATORS)
+                values = np.fromstring(text, sep=' ')
+                text = None
+                if offset + values.size > columns.size:
+                    raise ValueError(f"{path}: zone {len(zones)} has more than "
+                                     f"{columns.size} values")
+                _store_plt_values(columns, offset, values, block)
+                offset += values.size
+
+            zones.append({"title": zone.get("T", ""),
+                          "columns": {name: columns[index] for index, name in enumerate(variables)},
+                          "i": i, "j": j, "k": k if k > 1 else 0})
+    return zones
+
+
+def parse_plt(path: str, dtype=np.float64, cache: bool = True,
+              rebuild_cache: bool = False, zone: int = 0) -> StreamData:
+    """Parses .plt file, or maps its columns back from the binary cache
+
+    Args:
+        path (str): path to plt file
+        dtype (optional): float dtype of field columns. Defaults to float64.
+        cache (bool, optional): use and fill the cache. Defaults to True.
+        rebuild_cache (bool, optional): parse file and rewrite its cache even if valid.
+        zone (int, optional): index of zone to get. Defaults to 0.
+
+    Returns:
+        StreamData: parsed StreamData
+    """
+
+    part = f"zone{zone}"
+    if cache and not rebuild_cache:
+        cached = load_cached(path, part, dtype=dtype)
+        if cached is not None and len(cached["columns"]) == len(cached["schema"]):
+            return StreamData(cached["columns"], cached["i"], cached["j"], cached["k"],
+                              dtype=dtype)
+
+    zones = read_plt_zones(path, dtype)
+    if zone >= len(zones):
+        raise ValueError(f"{path} has only {len(zones)} zones")
+    if cache:
+        for index, parsed in enumerate(zones):
+            store_cached(path, parsed["columns"], parsed["i"], parsed["j"], parsed["k"],
+                         f"zone{index}", dtype=dtype)
+
+    parsed = zones[zone]
+    return StreamData(parsed["columns"], parsed["i"], parsed["j"], parsed["k"], dtype=dtype)
+
+
+def _row_format(columns: dict, separator: str, precision: int = None) -> str:
+    """%-format of one row: floating columns get precision significant digits if given,
+    everything else is written as str() of value"""
+
+    formats = []
+    for values in columns.values():
+        floating = values.dtype.kind == 'f'
+        formats.append(f"%.{precision}g" if precision is not None and floating else "%s")
+    return separator.join(formats) + "\n"
+
+
+def _format_block(columns: dict, start: int, end: int, block_format: str,
+                  shortest: bool, block: np.ndarray) -> bytes:
+    """Formats rows start:end with a single % operation over all of their values,
+    which are gathered into block, object array of (rows, columns) or more rows"""
+
+    # object block keeps ints as ints and floats as python floats, which print exact
+    block = block[:end - start]
+    for index, values in enumerate(columns.values()):
+        values = values[start:end]
+        if shortest and values.dtype == np.float32:
+            # float64 of shortest float32 digits prints them back, like pandas does
+            values = values.astype(str).astype(np.float64)
+        block[:, index] = values
+    return (block_format % tuple(block.ravel().tolist())).encode()
+
+
+def write_rows(file, columns: dict, separator: str, precision: int = None,
+               chunk_rows: int = WRITE_CHUNK):
+    """Writes rows of columns to binary file in blocks of chunk_rows formatted at once.
+    Gathering array and format of whole block are made once and reused by every block
+
+    Args:
+        file: file opened for binary writing
+        columns (dict): column name to 1d array, all of the same length
+        separator (str): separator of values in row
+        precision (int, optional): significant digits of floats, shortest exact if None
+        chunk_rows (int, optional): rows in block. Defaults to WRITE_CHUNK.
+    """
+
+    rows = len(next(iter(columns.values()), ()))
+    row_format = _row_format(columns, separator, precision)
+    block = np.empty((min(chunk_rows, rows), len(columns)), dtype=object)
+    block_format = row_format * block.shape[0]
+    for start in range(0, rows, chunk_rows):
+        end = min(start + chunk_rows, rows)
+        if end - start < block.shape[0]:
+            block_format = row_format * (end - start)
+        file.write(_format_block(columns, start, end, block_format, precision is None, block))
+
+
+def _plt_title(path: str) -> str:
+    """TITLE of Tecplot file from header lines before its first zone data"""
+
+    lines = []
+    with open(path, "rb") as file:
+        for line in file:
+            if line.strip() and not _PLT_KEYWORD.match(line):
+                break
+            lines.append(line.decode())
+    match = re.search(r'^\s*TITLE\s*=\s*"([^"]*)"', "".join(lines), re.I | re.M)
+    return match.group(1) if match else ""
+
+
+def output_plt(data: StreamData, original_file: str, new_file: str,
+               precision: int = None):
+    """Outputs StreamData to file as single POINT zone. Header is written anew from
+    schema and dimensions of data, only TITLE is taken from the original file
+
+    Args:
+        data (StreamData): Actual StreamData to output
+        original_file (str): Path to Original .plt file program got data from, or None
+        new_file (str): Path to New .plt file
+        precision (int, optional): significant digits of floats, shortest exact if None
+    """
+
+    title = _plt_title(original_file) if original_file is not None else ""
+    sizes = f"I={data.i}, J={data.j}" + (f", K={data.k}" if data.k else "")
+    header = (f'TITLE = "{title}"\n'
+              f'VARIABLES = {", ".join(chr(34) + str(name) + chr(34) for name in data.schema)}\n'
+              f'ZONE {sizes}, DATAPACKING=POINT\n')
+
+    with open(new_file, "wb") as fn:
+        fn.write(header.encode())
+        write_rows(fn, data.arrays(), "\t", precision)
+
+
+def advance_to_column(data: StreamData, column_name: str, dtype=None) -> np.array:
+    """Outputs 2D (j, i) or 3D (k, j, i) view of column, in dtype of StreamData unless
+    dtype is given. Column of that dtype is not copied, so view sees later in-place
+    updates of the column. Column is loaded on first access.
+    """
+
+    column = data.column(column_name).astype(dtype or data.dtype, copy=False)
+
+    if data.k == 0:
+        return column.reshape((data.j, data.i))
+    return column.reshape((data.k, data.j, data.i))
 
 
 def update_dataset_column(data: StreamData, column: str, updating_list: np.ndarray):
-    """Updates dataset column of StreamData
+    """Updates dataset column of StreamData, writing into column buffer in place
+    when it has dtype of StreamData and is writable
 
     Args:
         data (StreamData): StreamData to update
         column (str): Name of column to update
-        updating_list (np.ndarray): 2d or 3d list with updated values
+        updating_list (np.ndarray): 2d or 3d array with updated values
     """
 
-    if data.k == 0:
-        y_dim, x_dim = updating_list.shape
-        data.dataset[column] = list(np.reshape(updating_list, (y_dim * x_dim)))
-    else:
-        z_dim, y_dim, x_dim = updating_list.shape
-        data.dataset[column] = list(np.reshape(updating_list, (z_dim * y_dim * x_dim)))
+    # read-only buffer, like memory-mapped cache, gets replaced instead
+    data.set_column(column, updating_list)
+
+
+def save_temp_streamdata(data: StreamData, filename, precision: int = None):
+    """Saves StreamData as csv to filename + '.out.csv'
+
+    Args:
+        data (StreamData): StreamData to save
+        filename: path without extension
+        precision (int, optional): significant digits of floats, shortest exact if None
+    """
+
+    columns = data.arrays()
 
+    # text columns may need csv quoting, leave them to pandas
+    if any(values.dtype.kind not in "biuf" for values in columns.values()):
+        data.to_pandas().to_csv(filename + '.out.csv', index=False, chunksize=100000,
+                                encoding='utf-8',
+                                float_format=None if precision is None else f"%.{precision}g")
+        return
 
-def save_temp_streamdata(data: StreamData, filename):
-    data.dataset.to_csv(filename + '.out.csv', index=False,
-                        chunksize=100000, encoding='utf-8')
+    with open(filename + '.out.csv', "wb") as file:
+        file.write((",".join(str(column) for column in columns) + "\n").encode())
+        write_rows(file, columns, ",", precision)